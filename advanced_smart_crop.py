@@ -10,33 +10,59 @@ import subprocess
 import json
 import os
 import logging
+import threading
 from collections import deque
 
+from ffmpeg_utils import FFMPEG_QUIET_ARGS, RESOLUTION_TARGETS, SMART_CROP_BITRATES, extract_frame_jpeg, run_ffmpeg_encode
+from smart_crop import is_static_subject
+
 logger = logging.getLogger(__name__)
 
+# Detection runs on a 1/DETECT_DOWNSCALE grayscale copy; Haar cost scales with
+# pixel count and faces in a 1080p frame are still far above minSize at half scale
+DETECT_DOWNSCALE = 2
+
+# Clips are cropped in parallel and OpenCV does not document detectMultiScale as
+# safe to call concurrently on one classifier, so each thread loads its own
+_thread_cascades = threading.local()
+
+def _load_cascades():
+    """Return this thread's (frontal, profile, upper body) Haar classifiers"""
+    cascades = getattr(_thread_cascades, 'cascades', None)
+    if cascades is None:
+        cascades = tuple(
+            cv2.CascadeClassifier(cv2.data.haarcascades + name)
+            for name in ('haarcascade_frontalface_default.xml',
+                         'haarcascade_profileface.xml',
+                         'haarcascade_upperbody.xml')
+        )
+        _thread_cascades.cascades = cascades
+    return cascades
+
 class AdvancedSmartCropper:
+    """Per-video tracker: holds smoothing history, so use one instance per video
+    and do not share it between threads"""
+    
     def __init__(self):
         """Initialize advanced face detection and tracking"""
-        # Load face detection classifier
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        self.profile_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_profileface.xml'
-        )
-        self.body_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_upperbody.xml'
-        )
+        # Face detection classifiers (cached per thread)
+        self.face_cascade, self.profile_cascade, self.body_cascade = _load_cascades()
         
         # Tracking parameters
         self.tracking_history = deque(maxlen=10)  # Keep last 10 focus points
+        
+        # Faces per sampled frame from the last analysis (reused by the letterbox pre-check)
+        self.sample_faces = []
+        self.frame_width = 0
         self.face_tracker = None
         self.last_faces = []
         
     def detect_all_faces(self, frame):
         """Detect faces using multiple methods and angles"""
         all_faces = []
+        k = DETECT_DOWNSCALE
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, (gray.shape[1] // k, gray.shape[0] // k), interpolation=cv2.INTER_AREA)
         
         # Enhance contrast
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
@@ -44,17 +70,17 @@ class AdvancedSmartCropper:
         
         # Frontal faces - more sensitive detection
         frontal = self.face_cascade.detectMultiScale(
-            gray, scaleFactor=1.05, minNeighbors=3, minSize=(30, 30),
+            gray, scaleFactor=1.05, minNeighbors=3, minSize=(30 // k, 30 // k),
             flags=cv2.CASCADE_SCALE_IMAGE
         )
-        all_faces.extend([(x, y, w, h, 1.0) for x, y, w, h in frontal])
+        all_faces.extend([(x * k, y * k, w * k, h * k, 1.0) for x, y, w, h in frontal])
         
         # Profile faces (left)
         try:
             profile = self.profile_cascade.detectMultiScale(
-                gray, scaleFactor=1.05, minNeighbors=3, minSize=(30, 30)
+                gray, scaleFactor=1.05, minNeighbors=3, minSize=(30 // k, 30 // k)
             )
-            all_faces.extend([(x, y, w, h, 0.8) for x, y, w, h in profile])
+            all_faces.extend([(x * k, y * k, w * k, h * k, 0.8) for x, y, w, h in profile])
         except:
             pass
         
@@ -62,21 +88,22 @@ class AdvancedSmartCropper:
         gray_flip = cv2.flip(gray, 1)
         try:
             profile_flip = self.profile_cascade.detectMultiScale(
-                gray_flip, scaleFactor=1.05, minNeighbors=3, minSize=(30, 30)
+                gray_flip, scaleFactor=1.05, minNeighbors=3, minSize=(30 // k, 30 // k)
             )
             h, w = gray.shape
             for x, y, fw, fh in profile_flip:
                 # Convert flipped coordinates back
-                all_faces.append((w - x - fw, y, fw, fh, 0.8))
+                all_faces.append(((w - x - fw) * k, y * k, fw * k, fh * k, 0.8))
         except:
             pass
         
         # Upper body detection as fallback
         if len(all_faces) == 0:  # Only if no faces found
             bodies = self.body_cascade.detectMultiScale(
-                gray, scaleFactor=1.1, minNeighbors=3, minSize=(50, 50)
+                gray, scaleFactor=1.1, minNeighbors=3, minSize=(50 // k, 50 // k)
             )
             for x, y, w, h in bodies:
+                x, y, w, h = x * k, y * k, w * k, h * k
                 # Estimate face position from upper body (top 30% of body detection)
                 face_y = y + int(h * 0.1)
                 face_h = int(h * 0.3)
@@ -287,6 +314,8 @@ class AdvancedSmartCropper:
         frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()  # Properties only; sampled frames come from FFmpeg keyframe seeks
+        self.frame_width = frame_width
         
         logger.info(f"Video: {frame_width}x{frame_height}, {total_frames} frames @ {fps:.1f} fps")
         
@@ -298,14 +327,14 @@ class AdvancedSmartCropper:
         
         for i in range(num_samples):
             frame_pos = min(i * sample_interval, total_frames - 1)
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
-            
-            ret, frame = cap.read()
-            if not ret:
+            jpeg = extract_frame_jpeg(video_path, frame_pos / (fps or 30.0))
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) if jpeg else None
+            if frame is None:
                 break
             
             # Detect faces
             faces = self.detect_all_faces(frame)
+            self.sample_faces.append(faces)
             face_counts.append(len(faces))
             
             if faces:
@@ -314,8 +343,6 @@ class AdvancedSmartCropper:
                     all_crops.append(crop)
                     logger.info(f"Frame {i+1}/{num_samples}: {len(faces)} faces, mode: {crop['mode']}")
         
-        cap.release()
-        
         if not all_crops:
             logger.info("No suitable crops found")
             return None
@@ -418,16 +445,32 @@ class AdvancedSmartCropper:
         return filter_str
 
 
-# Global instance
-advanced_cropper = AdvancedSmartCropper()
+def analyze_smooth_crop(input_path, aspect_ratio, num_samples=15):
+    """
+    Sample and detect faces once for a clip. The result answers the letterbox
+    pre-check and can be passed to smooth_smart_crop_video so the clip is not
+    decoded and scanned a second time.
+    """
+    cropper = AdvancedSmartCropper()
+    crop_data = cropper.analyze_video_smooth(input_path, aspect_ratio, num_samples=num_samples)
+    return {
+        'crop_data': crop_data,
+        'static_single_subject': is_static_subject(cropper.sample_faces, cropper.frame_width, num_samples),
+    }
 
-def smooth_smart_crop_video(input_path, output_path, aspect_ratio, resolution):
+def smooth_smart_crop_video(input_path, output_path, aspect_ratio, resolution, analysis=None):
     """
     Apply smooth smart cropping with multi-face handling
+    
+    analysis: result of analyze_smooth_crop for this clip, if already computed
     """
     try:
-        # Analyze video
-        crop_data = advanced_cropper.analyze_video_smooth(input_path, aspect_ratio, num_samples=15)
+        # Analyze video with a tracker owned by this call (unless the pre-check already did)
+        cropper = AdvancedSmartCropper()
+        if analysis is not None:
+            crop_data = analysis['crop_data']
+        else:
+            crop_data = cropper.analyze_video_smooth(input_path, aspect_ratio, num_samples=15)
         
         if not crop_data:
             logger.info("Advanced analysis suggests center crop")
@@ -441,51 +484,30 @@ def smooth_smart_crop_video(input_path, output_path, aspect_ratio, resolution):
         input_width = data['streams'][0]['width']
         input_height = data['streams'][0]['height']
         
-        # Resolution settings
-        resolution_map = {
-            "1080p": {"9:16": (1080, 1920), "16:9": (1920, 1080), "1:1": (1080, 1080)},
-            "720p": {"9:16": (720, 1280), "16:9": (1280, 720), "1:1": (720, 720)},
-            "480p": {"9:16": (480, 854), "16:9": (854, 480), "1:1": (480, 480)}
-        }
-        
-        target_w, target_h = resolution_map[resolution][aspect_ratio]
+        target_w, target_h = RESOLUTION_TARGETS[resolution][aspect_ratio]
         
         # Generate filter
-        filter_str = advanced_cropper.generate_smooth_ffmpeg_filter(
+        filter_str = cropper.generate_smooth_ffmpeg_filter(
             crop_data, input_width, input_height, target_w, target_h
         )
         
         if not filter_str:
             return False
         
-        # Bitrate settings
-        bitrates = {"1080p": "3M", "720p": "2M", "480p": "1M"}
-        bitrate = bitrates[resolution]
+        bitrate = SMART_CROP_BITRATES[resolution]
         
-        # Build FFmpeg command
+        # Build FFmpeg command (hardware encoder when available, else libx264)
         # Use -filter_complex for letterbox (complex filter), -vf for simple crop
-        if crop_data.get('letterbox'):
-            cmd = [
-                'ffmpeg',
-                '-i', input_path,
-                '-filter_complex', filter_str,  # Complex filter for blurred background
-                '-c:v', 'libx264',
-                '-b:v', bitrate,
-                '-c:a', 'aac',
-                '-preset', 'medium',
-                '-movflags', '+faststart',
-                '-y',
-                output_path
-            ]
-        else:
-            cmd = [
-                'ffmpeg',
+        filter_flag = '-filter_complex' if crop_data.get('letterbox') else '-vf'
+        
+        def build_cmd(input_args, video_args):
+            return [
+                'ffmpeg', *FFMPEG_QUIET_ARGS,
+                *input_args,
                 '-i', input_path,
-                '-vf', filter_str,  # Simple filter for regular crop
-                '-c:v', 'libx264',
-                '-b:v', bitrate,
+                filter_flag, filter_str,
+                *video_args,
                 '-c:a', 'aac',
-                '-preset', 'medium',
                 '-movflags', '+faststart',
                 '-y',
                 output_path
@@ -495,13 +517,13 @@ def smooth_smart_crop_video(input_path, output_path, aspect_ratio, resolution):
         if crop_data.get('letterbox'):
             logger.info(f"   Using complex filter with blurred background")
         
-        result = subprocess.run(cmd, capture_output=True, timeout=120)
+        returncode, stderr = run_ffmpeg_encode(build_cmd, bitrate, 'veryfast', timeout=120)
         
-        if result.returncode == 0:
+        if returncode == 0:
             logger.info(f"✓ Smooth smart crop complete: {output_path}")
             return True
         else:
-            logger.error(f"FFmpeg error: {result.stderr.decode()}")
+            logger.error(f"FFmpeg error: {stderr}")
             return False
             
     except Exception as e:
@@ -1,15 +1,24 @@
 import os
 import re
+import io
 import json
 import uuid
 import time
+import random
+import signal
 import requests
 import subprocess
 import tempfile
+import shutil
 import zipfile
+import hashlib
+import itertools
+import traceback
+import functools
 from pathlib import Path
+from types import MappingProxyType
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_file, send_from_directory, Response, after_this_request
+from flask import Flask, request, jsonify, send_file, send_from_directory, make_response, Response, after_this_request
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
@@ -17,6 +26,19 @@ import google.generativeai as genai
 from apscheduler.schedulers.background import BackgroundScheduler
 import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    import ijson
+except ImportError:
+    ijson = None
+try:
+    from diskcache import Cache
+except ImportError:
+    Cache = None
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 # Load environment variables
 load_dotenv()
@@ -27,12 +49,14 @@ logger = logging.getLogger(__name__)
 
 # Import smart cropping modules (after logger is initialized)
 from whisper_service import whisper_service
+from ffmpeg_utils import FFMPEG_QUIET_ARGS, FFMPEG_RUN_KW, RESOLUTION_TARGETS, run_ffmpeg, run_ffmpeg_encode
 try:
-    from advanced_smart_crop import smooth_smart_crop_video
+    from advanced_smart_crop import analyze_smooth_crop, smooth_smart_crop_video
     SMART_CROP_AVAILABLE = True
     logger.info("✓ Advanced smart cropping loaded (smooth tracking + multi-face)")
 except Exception as adv_error:
     logger.warning(f"Advanced smart cropping unavailable ({adv_error}); falling back to basic.")
+    analyze_smooth_crop = None  # Basic cropper analyzes inside smart_crop_video
     try:
         from smart_crop import smart_crop_video
         smooth_smart_crop_video = smart_crop_video  # Fallback to basic
@@ -42,96 +66,315 @@ except Exception as adv_error:
         SMART_CROP_AVAILABLE = False
         smooth_smart_crop_video = None
         logger.warning(f"⚠️ Smart cropping not available: {basic_error}")
+try:
+    from smart_crop import is_static_single_subject
+except Exception:
+    is_static_single_subject = None  # Letterbox fallback goes straight to Gemini
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-key-please-change-in-prod')
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max file size
+# Let the front proxy serve dist/ bytes: Apache mod_xsendfile (X-Sendfile) or an
+# nginx internal location aliased to dist/ (X-Accel-Redirect)
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '0') == '1'
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.getenv('X_ACCEL_REDIRECT_PREFIX', '')
+STATIC_ASSET_MAX_AGE = 31536000  # 1 year for content-hashed dist/assets/ files
 CORS(app)
 
 # Configure Gemini
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=GEMINI_API_KEY)
+# gRPC keeps one long-lived HTTP/2 channel per process, so every Gemini call after
+# the first multiplexes over an already-open TLS connection. Set GEMINI_TRANSPORT=rest
+# only where gRPC egress is blocked.
+genai.configure(api_key=GEMINI_API_KEY, transport=os.getenv('GEMINI_TRANSPORT', 'grpc'))
+GEMINI_MODEL_NAME = 'gemini-2.5-pro'
+# Uploaded-file states, compared as enum members (no per-poll .name lookup)
+FILE_STATE = genai.protos.File.State
+# Shared model handle; per-request settings go in generate_content(generation_config=...)
+GEMINI_LEGACY_MODEL = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME)
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 TEMP_FOLDER = 'temp'
 ALLOWED_EXTENSIONS = {'mp4', 'mov', 'webm'}
+# Resolved once so generated temp names are a plain concatenation (and independent
+# of later cwd changes) in the per-clip hot paths
+_TEMP_DIR = os.path.abspath(TEMP_FOLDER) + os.sep
+
+# Precompiled patterns/decoder for URL handling and Gemini response parsing
+_YT_VALIDATE_RE = re.compile(r'^(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+')
+_YT_ID_PATTERNS = (
+    re.compile(r'(?:youtube\.com\/watch\?v=|youtu\.be\/)([a-zA-Z0-9_-]{11})'),
+    re.compile(r'youtube\.com\/embed\/([a-zA-Z0-9_-]{11})'),
+)
+_RETRY_DELAY_RE = re.compile(r'retry in (\d+(?:\.\d+)?)')
+# 'SS', 'MM:SS' or 'HH:MM:SS', each optionally with fractional seconds
+_TS_RE = re.compile(r'\s*(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d*)?)\s*$')
+_JSON_DECODER = json.JSONDecoder()
+
+# Output encoding tables, keyed by resolution (read-only; frame sizes are
+# RESOLUTION_TARGETS in ffmpeg_utils)
+# Ultra high bitrates for professional quality
+VIDEO_BITRATES = MappingProxyType({
+    "4K": "100M",     # 80-140M range, using 100M for optimal balance
+    "1080p": "30M",   # 20-40M range, using 30M for optimal balance
+    "720p": "5M",     # 720p HD quality
+    "480p": "2M",     # 480p standard quality
+})
+# x264 presets for the CPU encode path. Quality is held by CRF/bitrate; slower
+# presets mostly buy compression, so veryfast trades a little size for ~2x speed.
+ENCODE_PRESETS = MappingProxyType({
+    "4K": "medium",       # Balanced quality/speed for 4K
+    "1080p": "veryfast",
+    "720p": "veryfast",
+    "480p": "veryfast",
+})
+# FFmpeg timeouts in seconds (ultra high quality needs extended time)
+ENCODE_TIMEOUTS = MappingProxyType({
+    "4K": 1800,       # 30 minutes for 4K ultra high quality
+    "1080p": 900,     # 15 minutes for 1080p ultra high quality
+    "720p": 240,      # 4 minutes for 720p
+    "480p": 180,      # 3 minutes for 480p
+})
+
+# Shared pool for per-clip FFmpeg work (extract + format). Clips are independent
+# subprocess jobs; the cap keeps concurrent encodes across sessions from
+# oversubscribing the CPU.
+FFMPEG_POOL = ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, 4), thread_name_prefix='ffmpeg')
+
+# Persistent cache of Gemini analysis results keyed by (source id, prompt hash, model)
+GEMINI_CACHE = Cache(os.path.join('.cache', 'gemini')) if Cache is not None else None
+GEMINI_CACHE_TTL = 7 * 86400  # 1 week
 
 # Create necessary directories
 for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, TEMP_FOLDER]:
     os.makedirs(folder, exist_ok=True)
     
-# Cleanup scheduler
-scheduler = BackgroundScheduler()
-
 def cleanup_old_files():
     """Remove files older than specified hours"""
     try:
         cleanup_hours = int(os.getenv('TEMP_FILE_CLEANUP_HOURS', 1))
-        cutoff_time = datetime.now() - timedelta(hours=cleanup_hours)
+        cutoff = (datetime.now() - timedelta(hours=cleanup_hours)).timestamp()
         
         for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, TEMP_FOLDER]:
-            if not os.path.exists(folder):
+            if not os.path.isdir(folder):
                 continue
-                
-            for file in Path(folder).glob('*'):
-                if file.is_file():
-                    file_time = datetime.fromtimestamp(file.stat().st_mtime)
-                    if file_time < cutoff_time:
-                        file.unlink()
-                        logger.info(f"Deleted old file: {file}")
+            
+            # scandir entries cache file type and stat, so each file costs one stat at most
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                        try:
+                            os.unlink(entry.path)
+                            logger.info(f"Deleted old file: {entry.path}")
+                        except OSError as e:
+                            logger.warning(f"Could not delete {entry.path}: {e}")
     except Exception as e:
         logger.error(f"Cleanup error: {e}")
 
-# Schedule cleanup every hour
-scheduler.add_job(cleanup_old_files, 'interval', hours=1)
-scheduler.start()
+def claim_scheduler_lock():
+    """Decide whether this process runs the cleanup scheduler.
+
+    RUN_SCHEDULER=1/0 forces it on/off. Otherwise the first process to take an
+    exclusive lock on a shared lock file wins and holds it for its lifetime,
+    so multi-worker WSGI servers run one cleanup job instead of N.
+    """
+    global _scheduler_lock_file
+    forced = os.getenv('RUN_SCHEDULER')
+    if forced in ('0', '1'):
+        return forced == '1'
+    if fcntl is None:
+        return True
+    lock_file = open(os.path.join(tempfile.gettempdir(), 'clipcraft-cleanup.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _scheduler_lock_file = lock_file  # Keep the handle (and the lock) alive
+    return True
+
+_scheduler_lock_file = None
+
+# Schedule cleanup every hour (one process only)
+scheduler = None
+if claim_scheduler_lock():
+    scheduler = BackgroundScheduler(daemon=True)
+    scheduler.add_job(cleanup_old_files, 'interval', hours=1, coalesce=True, max_instances=1)
+    scheduler.start()
+    logger.info("🧹 Cleanup scheduler started in this process")
+
+def zip_add_file(zipf, path, arcname):
+    """Copy a file into an open ZipFile in 1 MiB chunks (keeps its mtime/mode)"""
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    zinfo.compress_type = zipf.compression
+    with open(path, 'rb') as src, zipf.open(zinfo, 'w') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+def _unlink(path):
+    """Remove a file if present (no separate exists() check, no TOCTOU)"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def drop_page_cache(path):
+    """Tell the kernel a file's cached pages won't be read again soon (Linux/BSD only).
+
+    Intermediate clips stay on disk for reprocessing but are rarely reopened;
+    dropping their pages leaves the cache to the sources and outputs still in use.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def gemini_source_id(video_source, is_youtube):
+    """Stable identity for a Gemini input: the YouTube video ID or a sha256 of the file bytes"""
+    if is_youtube:
+        for pattern in _YT_ID_PATTERNS:
+            match = pattern.search(video_source)
+            if match:
+                return f"yt:{match.group(1)}"
+        return f"url:{video_source}"
+    
+    digest = hashlib.sha256()
+    with open(video_source, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return f"file:{digest.hexdigest()}"
+
+def gemini_cache_key(video_source, is_youtube, prompt, *extra):
+    """Build a GEMINI_CACHE key, or None when the cache is unavailable"""
+    if GEMINI_CACHE is None:
+        return None
+    try:
+        source_id = gemini_source_id(video_source, is_youtube)
+    except OSError as e:
+        logger.warning(f"Could not fingerprint {video_source} for caching: {e}")
+        return None
+    return (source_id, hashlib.sha256(prompt.encode()).hexdigest(), GEMINI_MODEL_NAME, *extra)
+
+class TokenBucket:
+    """Process-wide request pacer: acquire() blocks until the next slot is free"""
+    
+    def __init__(self, rpm):
+        self.interval = 60.0 / max(1, rpm)
+        self.next_t = 0.0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        # Reserve a slot under the lock, sleep outside it
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_t)
+            self.next_t = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+# Queue Gemini requests locally instead of letting Google reject them with 429s
+GEMINI_LIMITER = TokenBucket(rpm=int(os.getenv('GEMINI_RPM', '60')))
+
+def _extract_json(text, open_ch='['):
+    """Decode the first JSON value starting at open_ch in text (e.g. inside ```json fences).
+
+    raw_decode scans linearly from each candidate position, so nested
+    brackets in descriptions are handled and there is no regex backtracking.
+    """
+    idx = text.find(open_ch)
+    while idx >= 0:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(text, idx)
+            return obj
+        except json.JSONDecodeError:
+            idx = text.find(open_ch, idx + 1)
+    return None
+
+def _next_backoff(prev, cap=60.0, base=1.0):
+    """Decorrelated-jitter backoff: next wait in [base, 3*prev], capped.
+
+    Starts around 1s and spreads out retries from parallel workers so they
+    don't hit the same quota in lockstep.
+    """
+    return min(cap, random.uniform(base, max(base, prev) * 3))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def validate_youtube_url(url):
     """Validate and normalize YouTube URL format"""
-    pattern = r'^(https?://)?(www\.)?(youtube\.com|youtu\.be)/.+'
-    return re.match(pattern, url) is not None
+    return _YT_VALIDATE_RE.match(url) is not None
 
+@functools.lru_cache(maxsize=1024)
 def normalize_youtube_url(url):
     """Normalize YouTube URL to standard format"""
     # Extract video ID
-    patterns = [
-        r'(?:youtube\.com\/watch\?v=|youtu\.be\/)([a-zA-Z0-9_-]{11})',
-        r'youtube\.com\/embed\/([a-zA-Z0-9_-]{11})',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
+    for pattern in _YT_ID_PATTERNS:
+        match = pattern.search(url)
         if match:
             video_id = match.group(1)
             # Return clean YouTube URL
             clean_url = f"https://www.youtube.com/watch?v={video_id}"
             logger.info(f"Normalized URL: {url} → {clean_url}")
+            return clean_url
     
     # If no pattern matches, return original
     return url
 
+# Resolved stream URLs per YouTube URL. googlevideo links are signed for about
+# 6 hours, so entries are reused for an hour to skip repeat yt-dlp runs.
+STREAM_URL_TTL = 3600
+_stream_url_cache = {}
+_stream_url_cache_lock = threading.Lock()
+# Serializes re-resolves so parallel clips hitting the same dead URL run yt-dlp once
+_stream_url_refresh_lock = threading.Lock()
+
 def get_video_stream_url(youtube_url):
-    """Get direct stream URL from YouTube with highest quality"""
+    """Get direct stream URL from YouTube with highest quality (cached for STREAM_URL_TTL)"""
+    now = time.monotonic()
+    with _stream_url_cache_lock:
+        cached = _stream_url_cache.get(youtube_url)
+    if cached and now - cached[0] < STREAM_URL_TTL:
+        logger.info("⚡ Using cached stream URL")
+        return cached[1]
+    
+    urls = resolve_video_stream_url(youtube_url)
+    if urls:
+        with _stream_url_cache_lock:
+            # Drop expired entries while we're here so the cache can't grow unbounded
+            for key in [k for k, (t, _) in _stream_url_cache.items() if now - t >= STREAM_URL_TTL]:
+                del _stream_url_cache[key]
+            _stream_url_cache[youtube_url] = (now, urls)
+    return urls
+
+def refresh_stream_url(youtube_url, stale_urls):
+    """Evict a cached stream URL that stopped working and resolve it again.
+
+    A cached googlevideo link can start returning 403 before STREAM_URL_TTL
+    (IP change, early expiry). If another clip already replaced the entry,
+    its fresh URL is returned without another yt-dlp run.
+    """
+    with _stream_url_refresh_lock:
+        with _stream_url_cache_lock:
+            cached = _stream_url_cache.get(youtube_url)
+            if cached and cached[1] == stale_urls:
+                del _stream_url_cache[youtube_url]
+        return get_video_stream_url(youtube_url)
+
+def resolve_video_stream_url(youtube_url):
+    """Run yt-dlp to get the direct stream URL(s) with highest quality"""
     try:
-        # First, check what formats are available
-        logger.info("🔍 Checking available video formats...")
-        list_result = subprocess.run(
-            ['yt-dlp', '--cookies-from-browser', 'chrome', '-F', youtube_url],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        if list_result.returncode == 0:
-            logger.info("Available formats:\n" + list_result.stdout)
-        
         # Format priority: Get highest quality video available
         # Try multiple format options to ensure we get the best quality
         format_options = [
@@ -141,32 +384,25 @@ def get_video_stream_url(youtube_url):
         
         for format_opt in format_options:
             logger.info(f"🎬 Trying format: {format_opt}")
+            # One yt-dlp run resolves both the selected format and its stream URL(s)
             result = subprocess.run(
-                ['yt-dlp', '--cookies-from-browser', 'chrome', '-g', '-f', format_opt, youtube_url],
+                ['yt-dlp', '--cookies-from-browser', 'chrome', '-f', format_opt,
+                 '--print', 'format', '--print', 'urls', youtube_url],
                 capture_output=True,
                 text=True,
                 timeout=30
             )
             if result.returncode == 0:
-                urls = result.stdout.strip().split('\n')
+                selected_format, *urls = result.stdout.strip().split('\n')
                 logger.info(f"✓ SUCCESS! Got {len(urls)} stream URL(s) with format: {format_opt}")
-                
-                # Get info about the selected format
-                info_result = subprocess.run(
-                    ['yt-dlp', '--cookies-from-browser', 'chrome', '--get-format', '-f', format_opt, youtube_url],
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                if info_result.returncode == 0:
-                    logger.info(f"📊 Selected format details: {info_result.stdout.strip()}")
+                logger.info(f"📊 Selected format details: {selected_format}")
                 
                 # If we got 2 URLs, it's video and audio separately
                 if len(urls) == 2:
                     logger.info(f"📹 Video URL: {urls[0][:100]}...")
                     logger.info(f"🔊 Audio URL: {urls[1][:100]}...")
                     return urls  # Return both URLs
-                else:
+                elif urls:
                     return urls[0]  # Return single URL (combined video+audio)
             else:
                 logger.warning(f"✗ Format {format_opt} failed: {result.stderr}")
@@ -181,37 +417,24 @@ def get_video_stream_url(youtube_url):
 
 def parse_ts_to_seconds(ts):
     """Parse 'HH:MM:SS(.ms)', 'MM:SS(.ms)' or 'SS(.ms)' into seconds (float)."""
+    if ts is None:
+        return 0.0
+    m = _TS_RE.match(str(ts))
+    if m:
+        h, mins, sec = m.groups()
+        return int(h or 0) * 3600 + int(mins or 0) * 60 + float(sec)
     try:
-        if ts is None:
+        # Extract numbers like 01:02:03.5 or 03.5
+        vals = list(map(float, re.findall(r"\d+\.?\d*", str(ts))))
+        if not vals:
             return 0.0
-        s = str(ts).strip()
-        parts = s.split(':')
-        if len(parts) == 3:
-            h = int(parts[0])
-            m = int(parts[1])
-            sec = float(parts[2])
-            return h * 3600 + m * 60 + sec
-        elif len(parts) == 2:
-            m = int(parts[0])
-            sec = float(parts[1])
-            return m * 60 + sec
-        else:
-            return float(parts[0])
+        if len(vals) >= 3:
+            return vals[0] * 3600 + vals[1] * 60 + vals[2]
+        if len(vals) == 2:
+            return vals[0] * 60 + vals[1]
+        return vals[0]
     except Exception:
-        try:
-            # Extract numbers like 01:02:03.5 or 03.5
-            import re
-            nums = re.findall(r"\d+\.?\d*", str(ts))
-            if not nums:
-                return 0.0
-            vals = list(map(float, nums))
-            if len(vals) >= 3:
-                return vals[0] * 3600 + vals[1] * 60 + vals[2]
-            if len(vals) == 2:
-                return vals[0] * 60 + vals[1]
-            return vals[0]
-        except Exception:
-            return 0.0
+        return 0.0
 
 def format_seconds_mmss(seconds: float) -> str:
     seconds = max(0.0, float(seconds))
@@ -288,34 +511,6 @@ def download_cloud_video(url, url_type, output_path):
         logger.error(f"Cloud download error: {e}")
         return False
 
-def download_sample_for_analysis(youtube_url, max_duration_minutes=10):
-    """Download a sample of the video for Gemini analysis with HIGH QUALITY"""
-    try:
-        temp_file = os.path.join(TEMP_FOLDER, f"sample_{uuid.uuid4()}.mp4")
-        
-        # Download first 10 minutes for analysis with GOOD QUALITY
-        logger.info(f"Downloading first {max_duration_minutes} minutes for AI analysis...")
-        
-        subprocess.run(
-            [
-                'yt-dlp',
-                '--cookies-from-browser', 'chrome',
-                '--download-sections', f'*00:00:00-00:{max_duration_minutes:02d}:00',
-                '-f', 'bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/best[height<=1080][ext=mp4]/best',  # Use 1080p quality
-                '-o', temp_file,
-                youtube_url
-            ],
-            check=True,
-            timeout=300,  # Extended timeout for higher quality download
-            capture_output=True
-        )
-        
-        logger.info(f"High-quality sample downloaded: {temp_file}")
-        return temp_file
-    except Exception as e:
-        logger.error(f"Sample download error: {e}")
-        return None
-
 def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_prompt=None, is_youtube=False):
     """Analyze video with Gemini API to identify engaging moments or follow custom prompt"""
     try:
@@ -373,14 +568,17 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
             IMPORTANT: Focus ONLY on what the user requested. If they ask for "goals" only return goal moments.
             If they ask for "funny moments" only return funny moments. Be very specific to their request.
             
-            Return results in valid JSON format with an array of objects, each having keys: 'start_time', 'end_time', 'description', 'letterbox'.
+            Return results in valid JSON format with an array of objects, each having keys: 'start_time', 'end_time', 'description', 'letterbox', 'letterbox_reason', 'letterbox_confidence'.
+            'letterbox_reason' is one sentence explaining the letterbox decision; 'letterbox_confidence' is "high", "medium" or "low".
             Example format:
             [
                 {{
                     "start_time": "00:30",
                     "end_time": "01:00",
                     "description": "Description of what happens related to user request",
-                    "letterbox": false
+                    "letterbox": false,
+                    "letterbox_reason": "Single speaker centered in frame",
+                    "letterbox_confidence": "high"
                 }}
             ]
             """
@@ -412,14 +610,17 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
             {duration_instruction}
             Ensure each segment captures a complete thought or action.
             
-            Return results in valid JSON format with an array of objects, each having keys: 'start_time', 'end_time', 'description', 'letterbox'.
+            Return results in valid JSON format with an array of objects, each having keys: 'start_time', 'end_time', 'description', 'letterbox', 'letterbox_reason', 'letterbox_confidence'.
+            'letterbox_reason' is one sentence explaining the letterbox decision; 'letterbox_confidence' is "high", "medium" or "low".
             Example format:
             [
                 {{
                     "start_time": "00:30",
                     "end_time": "01:00",
                     "description": "Engaging moment description",
-                    "letterbox": false
+                    "letterbox": false,
+                    "letterbox_reason": "Single speaker centered in frame",
+                    "letterbox_confidence": "high"
                 }}
             ]
             """
@@ -427,6 +628,18 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
         logger.info(f"Using {'custom' if custom_prompt else 'default'} prompt for video analysis")
         logger.info(f"Prompt preview: {prompt[:200]}...")
         
+        cache_key = gemini_cache_key(video_source, is_youtube, prompt)
+        if cache_key is not None:
+            cached = GEMINI_CACHE.get(cache_key)
+            if cached:
+                logger.info(f"⚡ Using cached Gemini analysis ({len(cached)} timestamps)")
+                return cached
+        
+        # Set temperature to 0.2 for custom prompts to ensure focused responses
+        generation_config = genai.GenerationConfig(
+            temperature=0.2 if custom_prompt and custom_prompt.strip() else 1.0
+        )
+        
         # Call Gemini API with CORRECT format based on source
         if is_youtube:
             # NEW API FORMAT: For YouTube URLs, use file_data with file_uri
@@ -437,16 +650,15 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
             max_retries = 5
             total_timeout = 180  # 3 minutes
             elapsed_time = 0
+            wait_time = 0.0
             
             for attempt in range(max_retries):
                 try:
                     logger.info(f"   Attempt {attempt + 1}/{max_retries}...")
-                    # Set temperature to 0.2 for custom prompts to ensure focused responses
-                    generation_config = genai.GenerationConfig(
-                        temperature=0.2 if custom_prompt and custom_prompt.strip() else 1.0
+                    GEMINI_LIMITER.acquire()
+                    response = GEMINI_LEGACY_MODEL.generate_content(
+                        [prompt, video_source], generation_config=generation_config
                     )
-                    model = genai.GenerativeModel('gemini-2.5-pro', generation_config=generation_config)
-                    response = model.generate_content([prompt, video_source])
                     logger.info("✓ Gemini API call successful - YouTube video analyzed!")
                     response_text = response.text
                     break  # Success, exit retry loop
@@ -457,12 +669,12 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
                     # Check if rate limit or connection error
                     if '429' in error_str or 'RESOURCE_EXHAUSTED' in error_str:
                         # Extract retry delay from error message
-                        delay_match = re.search(r'retry in (\d+(?:\.\d+)?)', error_str.lower())
+                        delay_match = _RETRY_DELAY_RE.search(error_str.lower())
                         if delay_match:
                             wait_time = float(delay_match.group(1))
                         else:
-                            # Default exponential backoff
-                            wait_time = min(30 * (2 ** attempt), 60)  # Cap at 60s
+                            # Jittered exponential backoff, capped at 60s
+                            wait_time = _next_backoff(wait_time)
                         
                         elapsed_time += wait_time
                         
@@ -505,25 +717,25 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
             # Wait for file to be processed
             max_wait = 120
             wait_time = 0
-            while uploaded_file.state.name == "PROCESSING" and wait_time < max_wait:
-                logger.info(f"   Processing video... ({wait_time}s)")
-                time.sleep(3)
-                wait_time += 3
+            interval = 0.25
+            while uploaded_file.state == FILE_STATE.PROCESSING and wait_time < max_wait:
+                logger.info(f"   Processing video... ({wait_time:.1f}s)")
+                time.sleep(interval)
+                wait_time += interval
+                interval = min(interval * 1.7, 4.0)  # Geometric backoff: fast for short clips
                 uploaded_file = genai.get_file(uploaded_file.name)
             
-            if uploaded_file.state.name != "ACTIVE":
+            if uploaded_file.state != FILE_STATE.ACTIVE:
                 logger.error(f"Video state: {uploaded_file.state.name}")
                 raise Exception(f"Video processing failed: {uploaded_file.state.name}")
             
             logger.info("✓ File ready for analysis")
 
             try:
-                # Set temperature to 0.2 for custom prompts to ensure focused responses
-                generation_config = genai.GenerationConfig(
-                    temperature=0.2 if custom_prompt and custom_prompt.strip() else 1.0
+                GEMINI_LIMITER.acquire()
+                response = GEMINI_LEGACY_MODEL.generate_content(
+                    [uploaded_file, prompt], generation_config=generation_config
                 )
-                model = genai.GenerativeModel(model_name="gemini-2.5-pro", generation_config=generation_config)
-                response = model.generate_content([uploaded_file, prompt])
                 logger.info("✓ Gemini API call successful - Uploaded file analyzed!")
                 response_text = response.text
             except Exception as api_error:
@@ -536,9 +748,8 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
         logger.info(f"   First 300 chars of response: {response_text[:300]}...")
         
         # Clean up response to extract JSON
-        json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-        if json_match:
-            timestamps = json.loads(json_match.group())
+        timestamps = _extract_json(response_text, '[')
+        if timestamps is not None:
             logger.info(f"✓ Successfully parsed {len(timestamps)} timestamps from Gemini")
             
             # Validate timestamps
@@ -547,6 +758,8 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
                 logger.info(f"   Clip {i+1}: {ts['start_time']} - {ts['end_time']}")
                 logger.info(f"           Description: {ts.get('description', 'No description')}")
             
+            if cache_key is not None:
+                GEMINI_CACHE.set(cache_key, timestamps, expire=GEMINI_CACHE_TTL)
             return timestamps
         else:
             # Try to parse the entire response as JSON
@@ -561,7 +774,6 @@ def analyze_video_with_gemini(video_source, num_clips, clip_duration, custom_pro
     except Exception as e:
         logger.error(f"Gemini analysis error: {e}")
         logger.error(f"Error type: {type(e).__name__}")
-        import traceback
         logger.error(f"Full traceback: {traceback.format_exc()}")
         logger.warning("Falling back to default timestamps - VIDEO WAS NOT ANALYZED BY AI!")
         # Return default timestamps if analysis fails
@@ -584,13 +796,13 @@ def generate_default_timestamps(num_clips, clip_duration):
     timestamps = []
     for i in range(max(1, n)):
         start_seconds = i * (dur + 10)  # Add 10s spacing
-        start_time = f"{start_seconds // 60:02d}:{start_seconds % 60:02d}"
-        end_seconds = start_seconds + dur
-        end_time = f"{end_seconds // 60:02d}:{end_seconds % 60:02d}"
+        start_m, start_s = divmod(start_seconds, 60)
+        end_m, end_s = divmod(start_seconds + dur, 60)
         timestamps.append({
-            "start_time": start_time,
-            "end_time": end_time,
-            "description": f"Segment {i + 1}"
+            "start_time": f"{start_m:02d}:{start_s:02d}",
+            "end_time": f"{end_m:02d}:{end_s:02d}",
+            "description": f"Segment {i + 1}",
+            "letterbox": False  # No AI available: don't re-query Gemini per clip
         })
     return timestamps
 
@@ -637,19 +849,27 @@ Respond ONLY with valid JSON:
     "confidence": "high" or "medium" or "low"
 }}"""
 
+        cache_key = gemini_cache_key(video_path, is_youtube, prompt, start_time, end_time)
+        if cache_key is not None:
+            cached = GEMINI_CACHE.get(cache_key)
+            if cached is not None:
+                logger.info(f"   ⚡ Using cached AI decision: {'📹 LETTERBOX' if cached else '📱 STANDARD'}")
+                return cached
+
         if is_youtube:
             # Use new API for YouTube videos with retry logic
             max_retries = 3
             total_timeout = 180  # 3 minutes
             elapsed_time = 0
+            wait_time = 0.0
             
             for attempt in range(max_retries):
                 try:
                     logger.info(f"   AI attempt {attempt + 1}/{max_retries}...")
                     # Upload the video file
                     video_file = genai.upload_file(path=video_path)
-                    model = genai.GenerativeModel('gemini-2.5-pro')
-                    response = model.generate_content([prompt, video_file])
+                    GEMINI_LIMITER.acquire()
+                    response = GEMINI_LEGACY_MODEL.generate_content([prompt, video_file])
                     response_text = response.text
                     break  # Success
                     
@@ -658,8 +878,8 @@ Respond ONLY with valid JSON:
                     
                     if '429' in error_str or 'RESOURCE_EXHAUSTED' in error_str:
                         # Extract retry delay
-                        delay_match = re.search(r'retry in (\d+(?:\.\d+)?)', error_str.lower())
-                        wait_time = float(delay_match.group(1)) if delay_match else min(20 * (2 ** attempt), 45)
+                        delay_match = _RETRY_DELAY_RE.search(error_str.lower())
+                        wait_time = float(delay_match.group(1)) if delay_match else _next_backoff(wait_time, cap=45.0)
                         
                         elapsed_time += wait_time
                         
@@ -693,23 +913,24 @@ Respond ONLY with valid JSON:
             # Wait for processing (shorter timeout for clips)
             max_wait = 60
             wait_time = 0
-            while uploaded_file.state.name == "PROCESSING" and wait_time < max_wait:
-                time.sleep(2)
-                wait_time += 2
+            interval = 0.25
+            while uploaded_file.state == FILE_STATE.PROCESSING and wait_time < max_wait:
+                time.sleep(interval)
+                wait_time += interval
+                interval = min(interval * 1.7, 4.0)  # Geometric backoff: fast for short clips
                 uploaded_file = genai.get_file(uploaded_file.name)
             
-            if uploaded_file.state.name != "ACTIVE":
+            if uploaded_file.state != FILE_STATE.ACTIVE:
                 logger.warning(f"   Clip processing timeout, defaulting to standard crop")
                 return False
             
-            model = genai.GenerativeModel(model_name="gemini-2.5-pro")
-            response = model.generate_content([uploaded_file, prompt])
+            GEMINI_LIMITER.acquire()
+            response = GEMINI_LEGACY_MODEL.generate_content([uploaded_file, prompt])
             response_text = response.text
         
         # Parse JSON response
-        json_match = re.search(r'\{.*?\}', response_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
+        result = _extract_json(response_text, '{')
+        if isinstance(result, dict):
             needs_letterbox = result.get('needs_letterbox', False)
             reason = result.get('reason', 'No reason provided')
             confidence = result.get('confidence', 'low')
@@ -717,6 +938,8 @@ Respond ONLY with valid JSON:
             logger.info(f"   ✓ AI Decision: {'📹 LETTERBOX' if needs_letterbox else '📱 STANDARD'}")
             logger.info(f"   Reason: {reason} (confidence: {confidence})")
             
+            if cache_key is not None:
+                GEMINI_CACHE.set(cache_key, needs_letterbox, expire=GEMINI_CACHE_TTL)
             return needs_letterbox
         else:
             logger.warning(f"   Could not parse AI response, defaulting to standard crop")
@@ -727,8 +950,37 @@ Respond ONLY with valid JSON:
         logger.info(f"   Defaulting to standard crop")
         return False
 
+@functools.lru_cache(maxsize=64)
+def probe_stream_info(stream_url):
+    """Log (and return) the source stream's video info; cached so a batch of clips
+    from the same stream/file opens it for probing only once"""
+    try:
+        probe_cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,bit_rate,codec_name',
+            '-of', 'json',
+            stream_url
+        ]
+        probe_result = subprocess.run(probe_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30, text=True)
+        if probe_result.returncode == 0:
+            logger.info(f"📊 Input stream info: {probe_result.stdout}")
+            return probe_result.stdout
+    except Exception as e:
+        logger.warning(f"Stream probe failed: {e}")
+    return None
+
 def extract_clip_from_stream(stream_url, start_time, duration, output_path):
-    """Extract a clip from video stream with high quality re-encoding"""
+    """Extract a clip from video stream, stream-copying when possible.
+
+    The extracted clip is only an intermediate (format_video_clip always
+    re-encodes it), so it is first cut with -c copy. With -ss before -i the
+    copy starts at the preceding keyframe, and the MP4 edit list marks the
+    pre-roll so the next FFmpeg stage still begins exactly at start_time.
+    If the copy fails (e.g. codecs the MP4 muxer rejects), the clip is
+    re-encoded at high quality instead.
+    """
     try:
         # Check if we have separate video and audio streams
         is_dual_stream = isinstance(stream_url, list) and len(stream_url) == 2
@@ -737,9 +989,7 @@ def extract_clip_from_stream(stream_url, start_time, duration, output_path):
             video_url, audio_url = stream_url
             logger.info("🎬 Extracting from SEPARATE video and audio streams")
             
-            # Build command for dual streams with high quality re-encoding
-            cmd = [
-                'ffmpeg',
+            input_args = [
                 '-ss', start_time,
                 '-i', video_url,          # Video stream
                 '-ss', start_time,
@@ -747,55 +997,57 @@ def extract_clip_from_stream(stream_url, start_time, duration, output_path):
                 '-t', str(duration),
                 '-map', '0:v:0',          # Map video from first input
                 '-map', '1:a:0',          # Map audio from second input
-                '-c:v', 'libx264',        # Re-encode video
-                '-preset', 'slow',        # High quality preset
-                '-crf', '18',             # High quality (18 = near lossless)
-                '-c:a', 'aac',            # Re-encode audio
-                '-b:a', '192k',           # High quality audio
-                '-movflags', '+faststart',
-                '-y',
-                output_path
             ]
         else:
             # Single combined stream
             logger.info("🎬 Extracting from COMBINED stream")
             
-            # Probe the stream to verify input quality
-            probe_cmd = [
-                'ffprobe',
-                '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height,bit_rate,codec_name',
-                '-of', 'json',
-                stream_url
-            ]
-            probe_result = subprocess.run(probe_cmd, capture_output=True, timeout=30, text=True)
-            if probe_result.returncode == 0:
-                logger.info(f"📊 Input stream info: {probe_result.stdout}")
+            # Probe the stream to verify input quality (once per source, not per clip)
+            probe_stream_info(stream_url)
             
-            cmd = [
-                'ffmpeg',
+            input_args = [
                 '-ss', start_time,
                 '-i', stream_url,
                 '-t', str(duration),
-                '-c:v', 'libx264',           # Re-encode video
-                '-preset', 'slow',           # High quality preset
-                '-crf', '18',                # High quality (18 = near lossless)
-                '-c:a', 'aac',               # Re-encode audio
-                '-b:a', '192k',              # High quality audio
-                '-movflags', '+faststart',   # Fast streaming
-                '-y',
-                output_path
             ]
         
+        # Fast path: stream copy (no decode/encode at all)
+        copy_cmd = [
+            'ffmpeg', *FFMPEG_QUIET_ARGS,
+            *input_args,
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            '-y',
+            output_path
+        ]
+        returncode, stderr = run_ffmpeg(copy_cmd, timeout=300)
+        if returncode == 0 and os.path.getsize(output_path) > 0:
+            logger.info(f"✓ Extraction successful (stream copy): {output_path}")
+            return True
+        logger.warning(f"Stream copy failed, re-encoding clip: {stderr[-300:]}")
+        
+        # Fallback: high quality re-encode
+        cmd = [
+            'ffmpeg', *FFMPEG_QUIET_ARGS,
+            *input_args,
+            '-c:v', 'libx264',           # Re-encode video
+            '-preset', 'veryfast',       # Intermediate file: CRF holds quality, speed matters
+            '-crf', '18',                # High quality (18 = near lossless)
+            '-c:a', 'aac',               # Re-encode audio
+            '-b:a', '192k',              # High quality audio
+            '-movflags', '+faststart',   # Fast streaming
+            '-y',
+            output_path
+        ]
+        
         # Extended timeout for high quality extraction (5 minutes)
-        result = subprocess.run(cmd, capture_output=True, timeout=300)
+        returncode, stderr = run_ffmpeg(cmd, timeout=300)
         
-        if result.returncode == 0:
+        if returncode == 0:
             logger.info(f"✓ Extraction successful: {output_path}")
             return True
         else:
-            logger.error(f"FFmpeg extraction error: {result.stderr.decode()}")
+            logger.error(f"FFmpeg extraction error: {stderr}")
             return False
     except Exception as e:
         logger.error(f"Clip extraction error: {e}")
@@ -812,7 +1064,7 @@ def get_video_dimensions(video_path):
             '-of', 'json',
             video_path
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
         if result.returncode == 0:
             data = json.loads(result.stdout)
             if data['streams']:
@@ -821,28 +1073,33 @@ def get_video_dimensions(video_path):
         logger.error(f"Error getting video dimensions: {e}")
     return None, None
 
+def get_audio_info(video_path):
+    """Return (has_audio, duration_seconds) for a video using one ffprobe call"""
+    try:
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-show_entries', 'stream=codec_type:format=duration',
+            '-of', 'json',
+            video_path
+        ]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        if result.returncode == 0:
+            data = json.loads(result.stdout)
+            has_audio = any(stream.get('codec_type') == 'audio' for stream in data.get('streams', []))
+            duration = float(data.get('format', {}).get('duration') or 0)
+            return has_audio, duration
+    except Exception as e:
+        logger.error(f"Error probing audio: {e}")
+    return False, 0.0
+
 def format_video_with_letterbox(input_path, output_path, resolution):
     """Format video with letterbox mode (blurred background)"""
     try:
         logger.info("🎬 Creating letterbox with blurred background...")
         
-        # Resolution settings
-        resolution_map = {
-            "4K": (2160, 3840),
-            "1080p": (1080, 1920),
-            "720p": (720, 1280),
-            "480p": (480, 854)
-        }
-        # Ultra high bitrates for professional quality
-        bitrates = {
-            "4K": "100M",      # 80-140M range, using 100M for balance
-            "1080p": "30M",    # 20-40M range, using 30M for balance
-            "720p": "5M",
-            "480p": "2M"
-        }
-        
-        target_w, target_h = resolution_map[resolution]
-        bitrate = bitrates[resolution]
+        target_w, target_h = RESOLUTION_TARGETS[resolution]["9:16"]
+        bitrate = VIDEO_BITRATES[resolution]
         
         # Complex filter: blurred background + sharp foreground
         # Letterbox is 16:9 within 9:16 frame
@@ -861,59 +1118,47 @@ def format_video_with_letterbox(input_path, output_path, resolution):
             f"[bg][fg]overlay=(W-w)/2:(H-h)/2,setsar=1,setdar={target_w}/{target_h}"
         )
         
-        # Use quality-optimized presets
-        preset_map = {
-            "4K": "medium",
-            "1080p": "slow",
-            "720p": "slow",
-            "480p": "medium"
-        }
-        preset = preset_map[resolution]
-        
-        cmd = [
-            'ffmpeg',
-            '-i', input_path,
-            '-filter_complex', filter_complex,
-            '-c:v', 'libx264',
-            '-b:v', bitrate,
-            '-maxrate', bitrate,
-            '-bufsize', f"{int(bitrate[:-1]) * 2}M",
-            '-c:a', 'aac',
-            '-b:a', '192k',
-            '-preset', preset,
-            '-crf', '18',
-            '-movflags', '+faststart',
-            '-y',
-            output_path
-        ]
+        preset = ENCODE_PRESETS[resolution]
+        
+        # The blur/overlay filter graph runs on the CPU; only the encode is offloaded
+        def build_cmd(input_args, video_args):
+            return [
+                'ffmpeg', *FFMPEG_QUIET_ARGS,
+                *input_args,
+                '-i', input_path,
+                '-filter_complex', filter_complex,
+                *video_args,
+                '-c:a', 'aac',
+                '-b:a', '192k',
+                '-movflags', '+faststart',
+                '-y',
+                output_path
+            ]
         
         logger.info(f"   Letterbox: {letterbox_w}x{letterbox_h} in {target_w}x{target_h} frame")
         
-        # Adjust timeout based on resolution (ultra high quality needs extended time)
-        timeout_map = {
-            "4K": 1800,     # 30 minutes for 4K ultra high quality
-            "1080p": 900,   # 15 minutes for 1080p ultra high quality
-            "720p": 240,    # 4 minutes for 720p
-            "480p": 180     # 3 minutes for 480p
-        }
-        timeout = timeout_map[resolution]
+        timeout = ENCODE_TIMEOUTS[resolution]
         logger.info(f"   Processing with {timeout}s timeout ({timeout//60} minutes)...")
         
-        result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+        returncode, stderr = run_ffmpeg_encode(build_cmd, bitrate, preset, timeout, crf=18)
         
-        if result.returncode == 0:
+        if returncode == 0:
             logger.info(f"✓ Letterbox formatting complete: {output_path}")
             return True
         else:
-            logger.error(f"FFmpeg letterbox error: {result.stderr.decode()}")
+            logger.error(f"FFmpeg letterbox error: {stderr}")
             return False
             
     except Exception as e:
         logger.error(f"Letterbox formatting error: {e}")
         return False
 
-def format_video_clip(input_path, output_path, aspect_ratio, resolution, use_letterbox=False):
-    """Format video clip with specified aspect ratio and resolution"""
+def format_video_clip(input_path, output_path, aspect_ratio, resolution, use_letterbox=False, crop_analysis=None):
+    """Format video clip with specified aspect ratio and resolution
+
+    crop_analysis: analyze_smooth_crop result already computed for this clip
+    (by the letterbox pre-check), reused instead of sampling the clip again
+    """
 
     # Try letterbox first, but fall back to standard crop if FFmpeg fails
     if use_letterbox and aspect_ratio == "9:16":
@@ -931,7 +1176,12 @@ def format_video_clip(input_path, output_path, aspect_ratio, resolution, use_let
     ):
         logger.info("🤖 Smart crop enabled for standard 9:16 output (no letterbox).")
         try:
-            if smooth_smart_crop_video(input_path, output_path, aspect_ratio, resolution):
+            if crop_analysis is not None:
+                cropped = smooth_smart_crop_video(input_path, output_path, aspect_ratio, resolution,
+                                                  analysis=crop_analysis)
+            else:
+                cropped = smooth_smart_crop_video(input_path, output_path, aspect_ratio, resolution)
+            if cropped:
                 return True
             logger.warning("Smart crop did not produce output; falling back to center crop.")
         except Exception as smart_err:
@@ -942,103 +1192,62 @@ def format_video_clip(input_path, output_path, aspect_ratio, resolution, use_let
     # Fallback to standard center crop
     try:
         logger.info("📐 Using standard center crop")
-        # Get input video dimensions
-        input_width, input_height = get_video_dimensions(input_path)
-        if not input_width or not input_height:
-            logger.error(f"Could not get dimensions for {input_path}")
-            return False
-            
-        # Define target dimensions based on resolution
-        resolution_targets = {
-            "4K": {"9:16": (2160, 3840), "16:9": (3840, 2160), "1:1": (2160, 2160)},
-            "1080p": {"9:16": (1080, 1920), "16:9": (1920, 1080), "1:1": (1080, 1080)},
-            "720p": {"9:16": (720, 1280), "16:9": (1280, 720), "1:1": (720, 720)},
-            "480p": {"9:16": (480, 854), "16:9": (854, 480), "1:1": (480, 480)}
-        }
-        
-        # Define bitrates (ultra high for professional quality)
-        bitrates = {
-            "4K": "100M",     # 80-140M range, using 100M for optimal balance
-            "1080p": "30M",   # 20-40M range, using 30M for optimal balance
-            "720p": "5M",     # 720p HD quality
-            "480p": "2M"      # 480p standard quality
-        }
+        target_width, target_height = RESOLUTION_TARGETS[resolution][aspect_ratio]
+        bitrate = VIDEO_BITRATES[resolution]
         
-        # Get target dimensions
-        target_width, target_height = resolution_targets[resolution][aspect_ratio]
-        bitrate = bitrates[resolution]
-        
-        # Calculate scaling and cropping (no black bars)
-        target_aspect = target_width / target_height
-        input_aspect = input_width / input_height
-        
-        # Scale the video to fill the target dimensions, then center crop
-        if input_aspect > target_aspect:
-            # Input is wider than target - scale by height and crop width
-            scale_w = int(input_width * target_height / input_height)
-            scale_h = target_height
-            # Calculate crop position to center
-            crop_x = int((scale_w - target_width) / 2)
-            crop_y = 0
-            filter_complex = f"scale={scale_w}:{scale_h},crop={target_width}:{target_height}:{crop_x}:{crop_y}"
-        else:
-            # Input is taller than target - scale by width and crop height
-            scale_w = target_width
-            scale_h = int(input_height * target_width / input_width)
-            # Calculate crop position to center
-            crop_x = 0
-            crop_y = int((scale_h - target_height) / 2)
-            filter_complex = f"scale={scale_w}:{scale_h},crop={target_width}:{target_height}:{crop_x}:{crop_y}"
+        # Scale to fill the target, then center crop (no black bars). FFmpeg does the
+        # aspect math itself, so no ffprobe round-trip is needed per clip. When the
+        # input already matches the target, scale passes frames through untouched
+        # and the full-size crop only adjusts plane pointers.
+        filter_complex = (
+            f"scale={target_width}:{target_height}:force_original_aspect_ratio=increase,"
+            f"crop={target_width}:{target_height}"
+        )
         
         # Add aspect ratio metadata fix
         filter_complex += f",setsar=1,setdar={target_width}/{target_height}"
         
-        # Use quality-optimized presets (slower = better quality)
-        preset_map = {
-            "4K": "medium",      # Balanced quality/speed for 4K
-            "1080p": "slow",     # High quality for 1080p
-            "720p": "slow",      # High quality for 720p
-            "480p": "medium"     # Balanced for 480p
-        }
-        preset = preset_map[resolution]
+        # NVENC variant: decode and scale in VRAM, so only the output-sized frame
+        # crosses PCIe for the crop (there is no CUDA crop filter)
+        gpu_filter = (
+            f"scale_cuda={target_width}:{target_height}:force_original_aspect_ratio=increase,"
+            f"hwdownload,format=nv12,crop={target_width}:{target_height},"
+            f"setsar=1,setdar={target_width}/{target_height}"
+        )
+        
+        preset = ENCODE_PRESETS[resolution]
         
         # Build FFmpeg command with high quality settings
-        cmd = [
-            'ffmpeg',
-            '-i', input_path,
-            '-vf', filter_complex,
-            '-c:v', 'libx264',
-            '-b:v', bitrate,
-            '-maxrate', bitrate,          # Prevent quality drops
-            '-bufsize', f"{int(bitrate[:-1]) * 2}M",  # Buffer for consistent quality
-            '-c:a', 'aac',
-            '-b:a', '192k',               # High quality audio
-            '-preset', preset,
-            '-crf', '18',                 # Constant Rate Factor (18 = high quality)
-            '-movflags', '+faststart',
-            '-y',
-            output_path
-        ]
+        def build_cmd(input_args, video_args, video_filter=filter_complex):
+            return [
+                'ffmpeg', *FFMPEG_QUIET_ARGS,
+                *input_args,
+                '-i', input_path,
+                '-vf', video_filter,
+                *video_args,                  # Hardware encoder or libx264 at target bitrate
+                '-c:a', 'aac',
+                '-b:a', '192k',               # High quality audio
+                '-movflags', '+faststart',
+                '-y',
+                output_path
+            ]
         
-        logger.info(f"Formatting video: {input_width}x{input_height} -> {target_width}x{target_height} ({aspect_ratio}) with center crop")
+        def build_gpu_cmd(input_args, video_args):
+            return build_cmd(input_args, video_args, gpu_filter)
         
-        # Adjust timeout based on resolution (ultra high quality needs extended time)
-        timeout_map = {
-            "4K": 1800,     # 30 minutes for 4K ultra high quality
-            "1080p": 900,   # 15 minutes for 1080p ultra high quality
-            "720p": 240,    # 4 minutes for 720p
-            "480p": 180     # 3 minutes for 480p
-        }
-        timeout = timeout_map[resolution]
+        logger.info(f"Formatting video -> {target_width}x{target_height} ({aspect_ratio}) with center crop")
+        
+        timeout = ENCODE_TIMEOUTS[resolution]
         logger.info(f"Processing with {timeout}s timeout ({timeout//60} minutes)...")
         
-        result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+        returncode, stderr = run_ffmpeg_encode(build_cmd, bitrate, preset, timeout, crf=18,
+                                               build_gpu_cmd=build_gpu_cmd)
         
-        if result.returncode == 0:
+        if returncode == 0:
             logger.info(f"Successfully formatted video: {output_path}")
             return True
         else:
-            logger.error(f"FFmpeg formatting error: {result.stderr.decode()}")
+            logger.error(f"FFmpeg formatting error: {stderr}")
             return False
     except Exception as e:
         logger.error(f"Video formatting error: {e}")
@@ -1047,6 +1256,47 @@ def format_video_clip(input_path, output_path, aspect_ratio, resolution, use_let
 # Session storage for processing status
 processing_sessions = {}
 
+# Studio edits (split/delete/reformat) mutate a session's clips list from
+# concurrent requests. Locks and the filename -> position index live beside
+# processing_sessions so the status payload stays JSON-serializable.
+session_locks = {}
+session_clip_index = {}
+_session_locks_guard = threading.Lock()
+
+def get_session_lock(session_id):
+    """Return the lock guarding a session's clips list, creating it on first use"""
+    with _session_locks_guard:
+        lock = session_locks.get(session_id)
+        if lock is None:
+            lock = session_locks[session_id] = threading.Lock()
+        return lock
+
+def release_session_clips(session_id):
+    """Drop a session's lock and clip index once it has no clips left to edit.
+
+    Called (without the session lock held) by the process that owns the
+    entries. A lock another request currently holds is left in place.
+    """
+    with _session_locks_guard:
+        lock = session_locks.get(session_id)
+        if lock is not None:
+            if not lock.acquire(blocking=False):
+                return
+            del session_locks[session_id]
+            lock.release()
+        session_clip_index.pop(session_id, None)
+
+def index_session_clips(session_id, clips):
+    """Rebuild the filename -> list position index (call with the session lock held)"""
+    session_clip_index[session_id] = {c.get('filename'): i for i, c in enumerate(clips)}
+
+def find_session_clip(session_id, clips, filename):
+    """O(1) position of filename in clips, or -1 (call with the session lock held)"""
+    idx = session_clip_index.get(session_id, {}).get(filename, -1)
+    if 0 <= idx < len(clips) and clips[idx].get('filename') == filename:
+        return idx
+    return -1
+
 @app.route('/')
 def index():
     # Serve React app from dist
@@ -1065,7 +1315,8 @@ def get_features():
 def get_status(session_id):
     """Get processing status for a session"""
     if session_id in processing_sessions:
-        return jsonify(processing_sessions[session_id])
+        with get_session_lock(session_id):
+            return jsonify(processing_sessions[session_id])
     else:
         return jsonify({
             'status': 'not_found',
@@ -1211,18 +1462,126 @@ def reformat_clip(session_id, filename):
             return jsonify({ 'error': 'Failed to reformat clip' }), 500
 
         # Update processing_sessions entry if present
-        sess = processing_sessions.get(session_id)
-        if sess and 'clips' in sess:
-            for clip in sess['clips']:
-                if clip.get('filename') == filename:
-                    clip['letterbox'] = use_letterbox
-                    break
+        with get_session_lock(session_id):
+            sess = processing_sessions.get(session_id)
+            if sess and 'clips' in sess:
+                idx = find_session_clip(session_id, sess['clips'], filename)
+                if idx >= 0:
+                    sess['clips'][idx]['letterbox'] = use_letterbox
 
         return jsonify({ 'success': True, 'letterbox': use_letterbox })
     except Exception as e:
         logger.error(f"Reformat clip error: {e}")
         return jsonify({ 'error': str(e) }), 500
 
+def process_single_clip(session_id, session_folder, index, ts, source, duration, aspect_ratio, resolution, youtube_url=None):
+    """Extract and format one clip; returns its clips_info entry or None on failure.
+
+    source may be a cached YouTube stream URL (youtube_url given); if extraction
+    from it fails, the URL is re-resolved once and extraction retried.
+    """
+    i = index
+    temp_clip = _TEMP_DIR + f"temp_{session_id}_{i}.mp4"
+    final_clip = os.path.join(session_folder, f"clip_{i + 1}.mp4")
+    
+    # Extract clip from source (stream URL or local file - just the specific segment)
+    logger.info(f"  → Clip {i + 1}: extracting at {ts['start_time']} ({duration}s duration)...")
+    if not extract_clip_from_stream(source, ts['start_time'], duration, temp_clip):
+        fresh_source = refresh_stream_url(youtube_url, source) if youtube_url else None
+        if not fresh_source or fresh_source == source:
+            logger.error(f"  ✗ Failed to extract clip {i + 1}")
+            return None
+        logger.info(f"  → Clip {i + 1}: retrying with a re-resolved stream URL")
+        if not extract_clip_from_stream(fresh_source, ts['start_time'], duration, temp_clip):
+            logger.error(f"  ✗ Failed to extract clip {i + 1}")
+            return None
+    
+    # Use letterbox decision from initial Gemini analysis (already decided in one pass);
+    # only ask Gemini again about this clip if the first pass left the field out
+    use_letterbox = False
+    crop_analysis = None
+    if aspect_ratio == "9:16":
+        decision = ts.get('letterbox', ts.get('needs_letterbox'))
+        if decision is None and (analyze_smooth_crop is not None or is_static_single_subject is not None):
+            # A static single-subject shot never needs letterbox; skip the Gemini round-trip.
+            # The smart-crop analysis answers this and is handed on to the crop itself.
+            try:
+                if analyze_smooth_crop is not None:
+                    crop_analysis = analyze_smooth_crop(temp_clip, aspect_ratio)
+                    is_static = crop_analysis['static_single_subject']
+                else:
+                    is_static = is_static_single_subject(temp_clip)
+                if is_static:
+                    logger.info(f"  → Clip {i + 1}: static single subject, cropping without letterbox")
+                    decision = False
+            except Exception as e:
+                logger.warning(f"  Letterbox pre-check failed for clip {i + 1}: {e}")
+        if decision is None:
+            logger.info(f"  → Clip {i + 1}: no letterbox decision from first pass, analyzing clip...")
+            decision = analyze_clip_for_letterbox(
+                temp_clip, "00:00", format_seconds_mmss(duration), ts.get('description', '')
+            )
+        elif ts.get('letterbox_reason'):
+            logger.info(f"  → Clip {i + 1}: {ts['letterbox_reason']} (confidence: {ts.get('letterbox_confidence', 'low')})")
+        use_letterbox = bool(decision)
+    
+    # Format clip (crop to aspect ratio with AI-determined mode)
+    mode_str = "LETTERBOX" if use_letterbox else "STANDARD"
+    logger.info(f"  → Clip {i + 1}: formatting to {aspect_ratio} @ {resolution} (AI recommended {mode_str} mode)...")
+    if not format_video_clip(temp_clip, final_clip, aspect_ratio, resolution, use_letterbox, crop_analysis):
+        logger.error(f"  ✗ Failed to format clip {i + 1}")
+        return None
+    drop_page_cache(temp_clip)
+    
+    # Save metadata for reprocessing with different letterbox mode
+    # (temp_clip is kept - it's needed for letterbox toggle / reprocessing)
+    metadata_file = final_clip.replace('.mp4', '.meta.json')
+    with open(metadata_file, 'w') as f:
+        json.dump({
+            'temp_clip': os.path.basename(temp_clip),
+            'aspect_ratio': aspect_ratio,
+            'resolution': resolution,
+            'original_letterbox': use_letterbox
+        }, f)
+    
+    logger.info(f"  ✓ Clip {i + 1} complete!")
+    return {
+        'filename': f"clip_{i + 1}.mp4",
+        'url': f"/api/stream/{session_id}/clip_{i + 1}.mp4",
+        'description': ts.get('description', f'Clip {i + 1}'),
+        'start_time': ts['start_time'],
+        'end_time': ts['end_time'],
+        'letterbox': use_letterbox
+    }
+
+def run_clip_jobs(session_id, session_folder, clip_jobs, source, aspect_ratio, resolution, youtube_url=None):
+    """Run process_single_clip for every (index, ts, duration) job on FFMPEG_POOL.
+
+    Progress is reported as clips finish; results are returned in clip order.
+    """
+    futures = {
+        FFMPEG_POOL.submit(process_single_clip, session_id, session_folder, i, ts, source, duration, aspect_ratio, resolution, youtube_url): i
+        for i, ts, duration in clip_jobs
+    }
+    results = {}
+    for done, future in enumerate(as_completed(futures), 1):
+        i = futures[future]
+        try:
+            clip = future.result()
+        except Exception as e:
+            logger.error(f"  ✗ Clip {i + 1} failed: {e}")
+            clip = None
+        if clip:
+            results[i] = clip
+        processing_sessions[session_id] = {
+            'status': 'processing',
+            'progress': 40 + int((done / len(futures)) * 40),  # 40-80% range
+            'step': 3,
+            'message': f'Processed {done} of {len(futures)} clips...',
+            'session_id': session_id
+        }
+    return [results[i] for i in sorted(results)]
+
 def process_video_background(session_id, video_url, url_type, clip_duration, num_clips, aspect_ratio, resolution, custom_prompt):
     """Process video in background"""
     try:
@@ -1260,6 +1619,8 @@ def process_video_background(session_id, video_url, url_type, clip_duration, num
             logger.info("Gemini will analyze the FULL video directly from YouTube")
             logger.info("=" * 60)
             
+            # Resolve the stream URL (STEP 3) on the worker pool while Gemini analyzes
+            stream_url_future = FFMPEG_POOL.submit(get_video_stream_url, normalized_url)
             timestamps = analyze_video_with_gemini(normalized_url, num_clips, clip_duration, custom_prompt, is_youtube=True)
             
             logger.info("=" * 60)
@@ -1279,7 +1640,11 @@ def process_video_background(session_id, video_url, url_type, clip_duration, num
             
             # STEP 3: Get stream URL for clip extraction
             logger.info("STEP 3: Getting video stream URL for clip extraction...")
-            stream_url = get_video_stream_url(normalized_url)
+            try:
+                stream_url = stream_url_future.result()
+            except Exception as e:
+                logger.error(f"Stream URL lookup failed: {e}")
+                stream_url = None
             if not stream_url:
                 processing_sessions[session_id] = {
                     'status': 'error',
@@ -1301,21 +1666,8 @@ def process_video_background(session_id, video_url, url_type, clip_duration, num
             
             # STEP 4: Extract clips from stream based on Gemini timestamps
             logger.info("STEP 4: Extracting and formatting clips...")
+            clip_jobs = []
             for i, ts in enumerate(timestamps):
-                logger.info(f"Processing clip {i + 1}/{len(timestamps)}: {ts['start_time']} - {ts['end_time']}")
-                
-                # Update progress for each clip
-                clip_progress = 40 + int((i / len(timestamps)) * 40)  # 40-80% range
-                processing_sessions[session_id] = {
-                    'status': 'processing',
-                    'progress': clip_progress,
-                    'step': 3 if i > 0 else 2,
-                    'message': f'Processing clip {i+1} of {len(timestamps)}...',
-                    'session_id': session_id
-                }
-                temp_clip = os.path.join(TEMP_FOLDER, f"temp_{session_id}_{i}.mp4")
-                final_clip = os.path.join(session_folder, f"clip_{i + 1}.mp4")
-                
                 # Calculate duration (robust parsing)
                 start_seconds = parse_ts_to_seconds(ts['start_time'])
                 end_seconds = parse_ts_to_seconds(ts['end_time'])
@@ -1323,44 +1675,10 @@ def process_video_background(session_id, video_url, url_type, clip_duration, num
                 if duration < 0.4:
                     logger.warning(f"  ✗ Skipping near-zero duration clip ({duration:.3f}s) at {ts['start_time']} → {ts['end_time']}")
                     continue
-                
-                # Extract clip from stream (no download, just the specific segment)
-                logger.info(f"  → Extracting from stream at {ts['start_time']} ({duration}s duration)...")
-                if extract_clip_from_stream(stream_url, ts['start_time'], duration, temp_clip):
-                    # Use letterbox decision from initial Gemini analysis (already decided in one pass)
-                    use_letterbox = ts.get('letterbox', False) if aspect_ratio == "9:16" else False
-                    
-                    # Format clip (crop to aspect ratio with AI-determined mode)
-                    mode_str = "LETTERBOX" if use_letterbox else "STANDARD"
-                    logger.info(f"  → AI recommended: {mode_str} mode")
-                    logger.info(f"  → Formatting to {aspect_ratio} @ {resolution} ({mode_str} mode)...")
-                    if format_video_clip(temp_clip, final_clip, aspect_ratio, resolution, use_letterbox):
-                        # Save metadata for reprocessing with different letterbox mode
-                        metadata_file = final_clip.replace('.mp4', '.meta.json')
-                        with open(metadata_file, 'w') as f:
-                            json.dump({
-                                'temp_clip': os.path.basename(temp_clip),
-                                'aspect_ratio': aspect_ratio,
-                                'resolution': resolution,
-                                'original_letterbox': use_letterbox
-                            }, f)
-                        
-                        clips_info.append({
-                            'filename': f"clip_{i + 1}.mp4",
-                            'url': f"/api/stream/{session_id}/clip_{i + 1}.mp4",
-                            'description': ts.get('description', f'Clip {i + 1}'),
-                            'start_time': ts['start_time'],
-                            'end_time': ts['end_time'],
-                            'letterbox': use_letterbox
-                        })
-                        logger.info(f"  ✓ Clip {i + 1} complete!")
-                    else:
-                        logger.error(f"  ✗ Failed to format clip {i + 1}")
-                else:
-                    logger.error(f"  ✗ Failed to extract clip {i + 1} from stream")
-                    
-                # Keep temp file for letterbox toggle functionality
-                # (Do not delete temp_clip - it's needed for reprocessing)
+                clip_jobs.append((i, ts, duration))
+            
+            clips_info = run_clip_jobs(session_id, session_folder, clip_jobs, stream_url, aspect_ratio, resolution,
+                                       youtube_url=normalized_url)
             
             logger.info("=" * 60)
         
@@ -1380,7 +1698,7 @@ def process_video_background(session_id, video_url, url_type, clip_duration, num
             }
             
             # Download video from cloud storage
-            temp_video_path = os.path.join(TEMP_FOLDER, f"{session_id}_cloud_video.mp4")
+            temp_video_path = _TEMP_DIR + f"{session_id}_cloud_video.mp4"
             if not download_cloud_video(video_url, url_type, temp_video_path):
                 processing_sessions[session_id] = {
                     'status': 'error',
@@ -1422,78 +1740,33 @@ def process_video_background(session_id, video_url, url_type, clip_duration, num
             
             # Process cloud video similarly
             logger.info("STEP 2: Extracting and formatting clips...")
+            clip_jobs = []
             for i, ts in enumerate(timestamps):
-                # Update progress for each clip
-                clip_progress = 40 + int((i / len(timestamps)) * 40)  # 40-80% range
-                processing_sessions[session_id] = {
-                    'status': 'processing',
-                    'progress': clip_progress,
-                    'step': 3 if i > 0 else 2,
-                    'message': f'Processing clip {i+1} of {len(timestamps)}...',
-                    'session_id': session_id
-                }
-                
-                temp_clip = os.path.join(TEMP_FOLDER, f"temp_{session_id}_{i}.mp4")
-                final_clip = os.path.join(session_folder, f"clip_{i + 1}.mp4")
-                
-                # Calculate duration
-                start_parts = ts['start_time'].split(':')
-                end_parts = ts['end_time'].split(':')
-                start_seconds = int(start_parts[0]) * 60 + int(start_parts[1])
-                end_seconds = int(end_parts[0]) * 60 + int(end_parts[1])
-                duration = end_seconds - start_seconds
-                
-                # Extract clip from cloud video file
-                if extract_clip_from_stream(temp_video_path, ts['start_time'], duration, temp_clip):
-                    # Use letterbox decision from initial Gemini analysis (already decided in one pass)
-                    use_letterbox = ts.get('letterbox', False) if aspect_ratio == "9:16" else False
-                    
-                    # Format clip (crop to aspect ratio with AI-determined mode)
-                    mode_str = "LETTERBOX" if use_letterbox else "STANDARD"
-                    logger.info(f"  → AI recommended: {mode_str} mode")
-                    logger.info(f"  → Formatting to {aspect_ratio} @ {resolution} ({mode_str} mode)...")
-                    if format_video_clip(temp_clip, final_clip, aspect_ratio, resolution, use_letterbox):
-                        # Save metadata for reprocessing with different letterbox mode
-                        metadata_file = final_clip.replace('.mp4', '.meta.json')
-                        with open(metadata_file, 'w') as f:
-                            json.dump({
-                                'temp_clip': os.path.basename(temp_clip),
-                                'aspect_ratio': aspect_ratio,
-                                'resolution': resolution,
-                                'original_letterbox': use_letterbox
-                            }, f)
-                        
-                        clips_info.append({
-                            'filename': f"clip_{i + 1}.mp4",
-                            'url': f"/api/stream/{session_id}/clip_{i + 1}.mp4",
-                            'description': ts.get('description', f'Clip {i + 1}'),
-                            'start_time': ts['start_time'],
-                            'end_time': ts['end_time'],
-                            'letterbox': use_letterbox
-                        })
-                        logger.info(f"  ✓ Clip {i + 1} complete!")
-                    else:
-                        logger.error(f"  ✗ Failed to format clip {i + 1}")
-                else:
-                    logger.error(f"Failed to extract clip {i + 1}")
-                
-                # Keep temp file for letterbox toggle functionality
-                # (Do not delete temp_clip - it's needed for reprocessing)
+                # Calculate duration (robust parsing, accepts HH:MM:SS)
+                start_seconds = parse_ts_to_seconds(ts['start_time'])
+                end_seconds = parse_ts_to_seconds(ts['end_time'])
+                duration = max(0.0, end_seconds - start_seconds)
+                if duration < 0.4:
+                    logger.warning(f"  ✗ Skipping near-zero duration clip ({duration:.3f}s) at {ts['start_time']} → {ts['end_time']}")
+                    continue
+                clip_jobs.append((i, ts, duration))
+            
+            clips_info = run_clip_jobs(session_id, session_folder, clip_jobs, temp_video_path, aspect_ratio, resolution)
             
             # Clean up downloaded cloud video  
-            if os.path.exists(temp_video_path):
-                os.remove(temp_video_path)
+            _unlink(temp_video_path)
             
             logger.info("=" * 60)
 
         # Create ZIP of all clips
         if clips_info:
             zip_path = os.path.join(session_folder, 'all_clips.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
+            # MP4s are already compressed: store them, don't deflate
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
                 for clip in clips_info:
                     clip_path = os.path.join(session_folder, clip['filename'])
                     if os.path.exists(clip_path):
-                        zipf.write(clip_path, clip['filename'])
+                        zip_add_file(zipf, clip_path, clip['filename'])
                         logger.info(f"Added {clip['filename']} to ZIP")
             logger.info(f"Created ZIP file: {zip_path}")
 
@@ -1508,15 +1781,17 @@ def process_video_background(session_id, video_url, url_type, clip_duration, num
             return
 
         # Update session status to completed
-        processing_sessions[session_id] = {
-            'status': 'completed',
-            'progress': 100,
-            'step': 4,
-            'message': 'All clips ready!',
-            'session_id': session_id,
-            'clips': clips_info,
-            'zip_path': f'/api/download/{session_id}/all'
-        }
+        with get_session_lock(session_id):
+            processing_sessions[session_id] = {
+                'status': 'completed',
+                'progress': 100,
+                'step': 4,
+                'message': 'All clips ready!',
+                'session_id': session_id,
+                'clips': clips_info,
+                'zip_path': f'/api/download/{session_id}/all'
+            }
+            index_session_clips(session_id, clips_info)
         logger.info(f"Processing completed for session {session_id}")
         
     except Exception as e:
@@ -1527,6 +1802,10 @@ def process_video_background(session_id, video_url, url_type, clip_duration, num
             'error': str(e),
             'session_id': session_id
         }
+    finally:
+        # A failed run has no clips to edit; drop the lock its status polls created
+        if processing_sessions.get(session_id, {}).get('status') == 'error':
+            release_session_clips(session_id)
 
 @app.route('/api/stream/<session_id>/<filename>')
 def stream_video(session_id, filename):
@@ -1536,11 +1815,9 @@ def stream_video(session_id, filename):
         video_path = os.path.join(session_folder, filename)
         
         if os.path.exists(video_path):
-            # Return video with proper headers for streaming
-            response = send_file(video_path, mimetype='video/mp4')
-            response.headers['Accept-Ranges'] = 'bytes'
-            response.headers['Cache-Control'] = 'no-cache'
-            return response
+            # Range requests (seeking) via conditional=True; revalidate with the ETag
+            # since clips are rewritten in place by reprocessing
+            return send_file(video_path, mimetype='video/mp4', conditional=True, etag=True, max_age=0)
         else:
             return jsonify({'error': 'Video not found'}), 404
     except Exception as e:
@@ -1556,14 +1833,16 @@ def download_clip(session_id, filename):
             # Download all clips as ZIP
             zip_path = os.path.join(session_folder, 'all_clips.zip')
             if os.path.exists(zip_path):
-                return send_file(zip_path, as_attachment=True, download_name=f'clips_{session_id}.zip')
+                return send_file(zip_path, as_attachment=True, download_name=f'clips_{session_id}.zip',
+                                 conditional=True, etag=True, max_age=0)
             else:
                 return jsonify({'error': 'ZIP file not found'}), 404
         else:
             # Download individual clip
             clip_path = os.path.join(session_folder, filename)
             if os.path.exists(clip_path):
-                return send_file(clip_path, as_attachment=True, mimetype='video/mp4')
+                return send_file(clip_path, as_attachment=True, mimetype='video/mp4',
+                                 conditional=True, etag=True, max_age=0)
             else:
                 return jsonify({'error': 'File not found'}), 404
     except Exception as e:
@@ -1599,7 +1878,8 @@ def download_edited_clips(session_id):
         zip_path = os.path.join(session_folder, zip_filename)
         
         files_added = 0
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # MP4s are already compressed: store them, don't deflate
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
             for item in filenames:
                 # Handle both string filenames and dict format {'source': 'file.mp4', 'as': 'renamed.mp4'}
                 if isinstance(item, dict):
@@ -1612,7 +1892,7 @@ def download_edited_clips(session_id):
                 file_path = os.path.join(session_folder, filename)
                 if os.path.exists(file_path):
                     # Add file to ZIP with the specified archive name
-                    zipf.write(file_path, arcname=arcname)
+                    zip_add_file(zipf, file_path, arcname)
                     files_added += 1
                     logger.info(f"✓ Added {filename} to ZIP as {arcname}")
                 else:
@@ -1620,8 +1900,7 @@ def download_edited_clips(session_id):
         
         if files_added == 0:
             logger.error("No files were added to ZIP")
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
+            _unlink(zip_path)
             return jsonify({'error': 'No files found to download'}), 404
         
         logger.info(f"Created ZIP with {files_added} files: {zip_path}")
@@ -1630,9 +1909,8 @@ def download_edited_clips(session_id):
         @after_this_request
         def remove_zip(response):
             try:
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                    logger.info(f"Cleaned up ZIP: {zip_path}")
+                _unlink(zip_path)
+                logger.info(f"Cleaned up ZIP: {zip_path}")
             except Exception as e:
                 logger.error(f"Error removing ZIP: {e}")
             return response
@@ -1646,7 +1924,6 @@ def download_edited_clips(session_id):
         
     except Exception as e:
         logger.error(f"Download edited clips error: {e}")
-        import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -1740,27 +2017,25 @@ def generate_captioned_version(session_id, filename):
             captions = data['captions']
             logger.info(f"📝 Using captions from request body: {len(captions)} items")
         else:
-            with open(captions_file, 'r') as f:
-                caption_data = json.load(f)
-            captions = caption_data.get('captions', [])
+            captions = iter_saved_captions(captions_file)
         
-        logger.info(f"📝 Loaded {len(captions)} captions")
-        if len(captions) == 0:
+        # Peek at the first caption without materializing the rest
+        captions = iter(captions)
+        first_caption = next(captions, None)
+        if first_caption is None:
             logger.error("❌ No captions to burn - returning error")
             return jsonify({'error': 'No captions available'}), 404
         
         # Log first caption for debugging
-        if captions:
-            logger.info(f"📝 First caption: {captions[0]}")
+        logger.info(f"📝 First caption: {first_caption}")
+        captions = itertools.chain((first_caption,), captions)
         
         # Create output filename (replace original)
         output_filename = f"captioned_{filename}"
         output_path = os.path.join(session_folder, output_filename)
         
-        # Check if already exists - if so, delete and regenerate with new styles
-        if os.path.exists(output_path):
-            logger.info(f"Captioned version already exists, removing to regenerate with new styles: {output_filename}")
-            os.remove(output_path)
+        # Remove any existing captioned version so it is regenerated with the new styles
+        _unlink(output_path)
         
         # Burn captions using FFmpeg
         logger.info(f"🎬 Generating captioned version: {output_filename}")
@@ -1803,9 +2078,7 @@ def download_with_captions(session_id, filename):
             captions = data['captions']
             logger.info(f"📝 Using captions from request body: {len(captions)} items")
         else:
-            with open(captions_file, 'r') as f:
-                caption_data = json.load(f)
-            captions = caption_data.get('captions', [])
+            captions = iter_saved_captions(captions_file)
         
         # Create output path
         output_filename = f"captioned_{filename}"
@@ -1823,13 +2096,29 @@ def download_with_captions(session_id, filename):
         logger.error(f"Download with captions error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def iter_saved_captions(captions_file):
+    """Yield captions one at a time from a saved .captions.json file.
+
+    Uses ijson when installed so long transcripts are never fully loaded;
+    otherwise falls back to json.load.
+    """
+    with open(captions_file, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.items(f, 'captions.item', use_float=True)
+        else:
+            yield from json.load(f).get('captions', [])
+
 def burn_captions_ffmpeg(video_path, output_path, captions, style_options):
-    """Burn captions into video using FFmpeg"""
+    """Burn captions into video using FFmpeg.
+
+    ``captions`` may be a list or any iterable of caption dicts; it is
+    consumed once while the ASS file is written.
+    """
     try:
         # Create temporary ASS file (better style support than SRT)
-        temp_ass = os.path.join(tempfile.gettempdir(), f"captions_{uuid.uuid4()}.ass")
+        temp_ass = os.path.join(tempfile.gettempdir(), f"captions_{uuid.uuid4().hex}.ass")
         
-        logger.info(f"📝 Generating ASS subtitle file with {len(captions)} captions")
+        logger.info("📝 Generating ASS subtitle file")
         
         # Extract style options with fallbacks for both naming conventions
         # Sanitize font family: CSS values like "Inter, sans-serif" break ASS parser
@@ -2003,38 +2292,36 @@ def burn_captions_ffmpeg(video_path, output_path, captions, style_options):
             f"Spacing={spacing},"
             f"ScaleX=100,ScaleY=100"  # Ensure no scaling issues
         )
-        # Generate ASS subtitle file with embedded styles
-        ass_content = generate_ass_file(
-            captions,
-            style_options,
-            font,
-            font_size,
-            font_color_ass,
-            bg_color_ass,
-            outline_color_ass,
-            alignment,
-            margin_v,
-            border_style,
-            outline_width,
-            spacing,
-            ass_bold,
-            position_x,
-            position_y,
-            animation,
-            line_height
-        )
-        
+        # Generate ASS subtitle file with embedded styles, streamed straight to disk
         with open(temp_ass, 'w', encoding='utf-8') as f:
-            f.write(ass_content)
+            generate_ass_file(
+                captions,
+                style_options,
+                font,
+                font_size,
+                font_color_ass,
+                bg_color_ass,
+                outline_color_ass,
+                alignment,
+                margin_v,
+                border_style,
+                outline_width,
+                spacing,
+                ass_bold,
+                position_x,
+                position_y,
+                animation,
+                line_height,
+                out=f
+            )
         
-        logger.info(f"📝 ASS file created: {temp_ass}")
-        logger.info(f"📝 ASS preview (first 300 chars): {ass_content[:300]}")
+        logger.info(f"📝 ASS file created: {temp_ass} ({os.path.getsize(temp_ass)} bytes)")
         
         # Build FFmpeg command with ASS subtitles
         ass_for_filter = temp_ass.replace('\\', '\\\\').replace(':', '\\:')
         
         cmd = [
-            'ffmpeg',
+            'ffmpeg', *FFMPEG_QUIET_ARGS,
             '-i', video_path,
             '-vf', f"ass={ass_for_filter}",
             '-c:v', 'libx264',
@@ -2048,7 +2335,7 @@ def burn_captions_ffmpeg(video_path, output_path, captions, style_options):
         logger.info(f"🎬 Running FFmpeg with ASS subtitles")
         
         # Run FFmpeg with detailed error capture
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+        result = subprocess.run(cmd, **FFMPEG_RUN_KW, text=True, timeout=300)
         
         # Log results
         if result.returncode != 0:
@@ -2060,8 +2347,7 @@ def burn_captions_ffmpeg(video_path, output_path, captions, style_options):
                 logger.info(f"✅ Output file size: {os.path.getsize(output_path)} bytes")
         
         # Clean up temp file
-        if os.path.exists(temp_ass):
-            os.remove(temp_ass)
+        _unlink(temp_ass)
         
         return result.returncode == 0
         
@@ -2069,6 +2355,14 @@ def burn_captions_ffmpeg(video_path, output_path, captions, style_options):
         logger.error(f"FFmpeg caption burning error: {e}")
         return False
 
+# Single-pass escape table for ASS dialogue text: backslashes and braces are
+# escaped, newlines become ASS hard line breaks
+_ASS_ESCAPE_TABLE = str.maketrans({'\\': r'\\', '{': r'\{', '}': r'\}', '\n': r'\N'})
+
+def escape_ass_text(text: str) -> str:
+    """Escape caption text for an ASS Dialogue line"""
+    return text.translate(_ASS_ESCAPE_TABLE)
+
 def generate_ass_file(
     captions,
     style_options,
@@ -2086,9 +2380,14 @@ def generate_ass_file(
     position_x_percent,
     position_y_percent,
     animation,
-    line_height
+    line_height,
+    out=None
 ):
-    """Generate ASS subtitle file with embedded styles (square backgrounds only)"""
+    """Generate ASS subtitle file with embedded styles (square backgrounds only)
+
+    Lines are written to ``out`` (any text file-like object) as they are
+    produced. When ``out`` is None the content is returned as a string.
+    """
     
     logger.info(
         f"📝 ASS Style values: Font={font}, Size={font_size}, FgColor={font_color_ass}, "
@@ -2116,7 +2415,7 @@ def generate_ass_file(
     
     # ASS header with proper background rendering
     # Note: ASS backgrounds are always rectangular boxes, no rounded corners
-    ass_lines = [
+    header_lines = [
         "[Script Info]",
         "Title: Generated Subtitles",
         "ScriptType: v4.00+",
@@ -2133,10 +2432,13 @@ def generate_ass_file(
         "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text"
     ]
     
-    slide_offset = int(play_res_y * 0.1)  # 10% of screen height
+    buffer = io.StringIO() if out is None else out
+    write = buffer.write
+    for line in header_lines:
+        write(line)
+        write('\n')
     
-    def escape_ass_text(text: str) -> str:
-        return text.replace('\\', r'\\').replace('{', r'\{').replace('}', r'\}')
+    slide_offset = int(play_res_y * 0.1)  # 10% of screen height
     
     def build_animation_tags(anim: str, x: int, y: int):
         tags = []
@@ -2166,34 +2468,39 @@ def generate_ass_file(
         return tags, effect_field
     
     # Add dialogue lines
+    _fmt = format_time_for_ass
+    caption_count = 0
     for caption in captions:
-        start = format_time_for_ass(caption['start'])
-        end = format_time_for_ass(caption['end'])
-        text = escape_ass_text(str(caption.get('text', ''))).replace('\n', '\\N')
+        caption_count += 1
+        start = _fmt(caption['start'])
+        end = _fmt(caption['end'])
+        text = escape_ass_text(str(caption.get('text', '')))
         
         tags, effect_field = build_animation_tags(animation, base_pos_x, base_pos_y)
         override = ''.join(tags)
         if override:
             text = f"{{{override}}}{text}"
         
-        ass_lines.append(f"Dialogue: 0,{start},{end},Default,,0,0,0,{effect_field},{text}")
+        write(f"Dialogue: 0,{start},{end},Default,,0,0,0,{effect_field},{text}\n")
+    
+    logger.info(f"📝 Wrote {caption_count} caption events")
     
-    return '\n'.join(ass_lines)
+    if out is None:
+        return buffer.getvalue()
 
 def format_time_for_ass(seconds):
     """Convert seconds to ASS time format (H:MM:SS.CC)"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    centisecs = int((seconds % 1) * 100)
+    centisecs = int(seconds * 100)
+    minutes, centisecs = divmod(centisecs, 6000)
+    hours, minutes = divmod(minutes, 60)
+    secs, centisecs = divmod(centisecs, 100)
     return f"{hours}:{minutes:02d}:{secs:02d}.{centisecs:02d}"
 
 def format_time_for_srt(seconds):
-    """Convert seconds to SRT time format"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds % 1) * 1000)
+    """Convert seconds to SRT time format (rounded to the millisecond, like whisper_service)"""
+    secs, millis = divmod(round((seconds or 0) * 1000), 1000)
+    minutes, secs = divmod(secs, 60)
+    hours, minutes = divmod(minutes, 60)
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
 @app.route('/api/captions/<session_id>/<filename>')
@@ -2204,9 +2511,9 @@ def get_captions(session_id, filename):
         captions_file = os.path.join(session_folder, f"{filename}.captions.json")
         
         if os.path.exists(captions_file):
-            with open(captions_file, 'r') as f:
-                caption_data = json.load(f)
-            return jsonify(caption_data)
+            # Saved file is already the response shape; conditional=True answers
+            # repeat Studio fetches with 304 via ETag/Last-Modified
+            return send_file(captions_file, mimetype='application/json', conditional=True)
         else:
             return jsonify({'captions': [], 'fullText': '', 'language': 'en'})
             
@@ -2270,66 +2577,76 @@ def merge_clips(session_id):
             
         session_folder = os.path.join(OUTPUT_FOLDER, session_id)
         
-        # Create a text file with the list of videos to concatenate
-        list_file = os.path.join(session_folder, 'merge_list.txt')
         output_filename = f'merged_{uuid.uuid4().hex[:8]}.mp4'
         output_path = os.path.join(session_folder, output_filename)
         
-        # Create temporary trimmed clips if needed
-        temp_clips = []
-        with open(list_file, 'w') as f:
-            for clip_info in clips_to_merge:
-                filename = clip_info['filename']
-                start_time = clip_info.get('startTime', 0)
-                end_time = clip_info.get('endTime', None)
-                input_path = os.path.join(session_folder, filename)
-                
-                # If trimming is needed
-                if start_time > 0 or end_time is not None:
-                    temp_filename = f'temp_{uuid.uuid4().hex[:8]}.mp4'
-                    temp_path = os.path.join(session_folder, temp_filename)
-                    temp_clips.append(temp_path)
-                    
-                    # Trim the clip
-                    trim_cmd = ['ffmpeg', '-i', input_path]
-                    if start_time > 0:
-                        trim_cmd.extend(['-ss', str(start_time)])
-                    if end_time is not None:
-                        trim_cmd.extend(['-to', str(end_time)])
-                    trim_cmd.extend(['-c', 'copy', '-y', temp_path])
-                    
-                    subprocess.run(trim_cmd, capture_output=True, check=True)
-                    # Write absolute path to avoid path confusion
-                    f.write(f"file '{os.path.abspath(temp_path)}'\n")
-                else:
-                    # Write absolute path to avoid path confusion
-                    f.write(f"file '{os.path.abspath(input_path)}'\n")
+        # Normalize every segment to the first clip's geometry (concat needs matching sizes)
+        first_path = os.path.join(session_folder, clips_to_merge[0]['filename'])
+        target_w, target_h = get_video_dimensions(first_path)
+        if not target_w or not target_h:
+            return jsonify({'error': f"Could not read dimensions of {clips_to_merge[0]['filename']}"}), 404
+        
+        # Concat needs an audio pad on every segment or on none: silent clips get
+        # generated silence of their trimmed length, and if no clip has audio the
+        # merge is video-only
+        audio_info = [get_audio_info(os.path.join(session_folder, c['filename'])) for c in clips_to_merge]
+        with_audio = any(has_audio for has_audio, _ in audio_info)
+        
+        # Single FFmpeg graph: trims are applied as input options (-ss/-t before -i),
+        # then every input is decoded once and concatenated - no temp clips or list file
+        input_args = []
+        filter_parts = []
+        concat_inputs = ''
+        for i, clip_info in enumerate(clips_to_merge):
+            input_path = os.path.join(session_folder, clip_info['filename'])
+            start_time = clip_info.get('startTime', 0)
+            end_time = clip_info.get('endTime', None)
+            
+            if start_time > 0:
+                input_args.extend(['-ss', str(start_time)])
+            if end_time is not None:
+                input_args.extend(['-t', str(max(0, end_time - start_time))])
+            input_args.extend(['-i', input_path])
+            
+            filter_parts.append(
+                f"[{i}:v]scale={target_w}:{target_h}:force_original_aspect_ratio=decrease,"
+                f"pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2,setsar=1[v{i}]"
+            )
+            concat_inputs += f"[v{i}]"
+            if not with_audio:
+                continue
+            has_audio, clip_duration = audio_info[i]
+            if has_audio:
+                filter_parts.append(f"[{i}:a]aformat=sample_rates=48000:channel_layouts=stereo[a{i}]")
+            else:
+                segment_end = clip_duration if end_time is None else min(end_time, clip_duration or end_time)
+                filter_parts.append(
+                    f"anullsrc=r=48000:cl=stereo,atrim=duration={max(0, segment_end - start_time)}[a{i}]"
+                )
+            concat_inputs += f"[a{i}]"
+        
+        if with_audio:
+            filter_parts.append(f"{concat_inputs}concat=n={len(clips_to_merge)}:v=1:a=1[v][a]")
+            output_args = ['-map', '[v]', '-map', '[a]', '-c:a', 'aac', '-b:a', '192k']
+        else:
+            filter_parts.append(f"{concat_inputs}concat=n={len(clips_to_merge)}:v=1:a=0[v]")
+            output_args = ['-map', '[v]', '-an']
         
-        # Merge the clips using FFmpeg concat with re-encoding for compatibility
         cmd = [
-            'ffmpeg',
-            '-f', 'concat',
-            '-safe', '0',
-            '-i', list_file,
+            'ffmpeg', *FFMPEG_QUIET_ARGS,
+            *input_args,
+            '-filter_complex', ';'.join(filter_parts),
+            *output_args,
             '-c:v', 'libx264',
             '-preset', 'medium',
             '-crf', '23',
-            '-c:a', 'aac',
-            '-b:a', '192k',
             '-movflags', '+faststart',
             '-y',
             output_path
         ]
         
         logger.info(f"Running merge command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, timeout=300)
-        
-        # Clean up temporary files
-        if os.path.exists(list_file):
-            os.remove(list_file)
-        for temp_clip in temp_clips:
-            if os.path.exists(temp_clip):
-                os.remove(temp_clip)
+        result = subprocess.run(cmd, **FFMPEG_RUN_KW, timeout=300)
         
         if result.returncode == 0:
             logger.info(f"Successfully merged {len(clips_to_merge)} clips into {output_filename}")
@@ -2345,7 +2662,6 @@ def merge_clips(session_id):
             
     except Exception as e:
         logger.error(f"Merge clips error: {e}")
-        import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -2362,15 +2678,14 @@ def toggle_letterbox(session_id, filename):
         final_clip_path = os.path.join(session_folder, filename)
         metadata_file = final_clip_path.replace('.mp4', '.meta.json')
         
-        # Check if metadata exists
-        if not os.path.exists(metadata_file):
+        # Load metadata
+        try:
+            with open(metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
             logger.error(f"No metadata file found for {filename}")
             return jsonify({'error': 'Cannot toggle - metadata not found. Please regenerate clips.'}), 404
         
-        # Load metadata
-        with open(metadata_file, 'r') as f:
-            metadata = json.load(f)
-        
         # Temp clips are stored in TEMP_FOLDER, not session_folder
         temp_clip_path = os.path.join(TEMP_FOLDER, metadata['temp_clip'])
         
@@ -2413,7 +2728,6 @@ def toggle_letterbox(session_id, filename):
             
     except Exception as e:
         logger.error(f"Toggle letterbox error: {e}")
-        import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -2448,7 +2762,7 @@ def split_clip(session_id):
         # Extract first part (from 0 to time_in_clip) - MAXIMUM QUALITY
         duration1 = time_in_clip
         cmd1 = [
-            'ffmpeg', '-y',
+            'ffmpeg', *FFMPEG_QUIET_ARGS, '-y',
             '-i', original_clip_path,
             '-t', str(duration1),
             '-c:v', 'libx264',
@@ -2464,7 +2778,7 @@ def split_clip(session_id):
         # Using -ss BEFORE -i for faster seeking, then re-encode for accuracy
         duration2 = clip_end - split_time
         cmd2 = [
-            'ffmpeg', '-y',
+            'ffmpeg', *FFMPEG_QUIET_ARGS, '-y',
             '-ss', str(time_in_clip),
             '-i', original_clip_path,
             '-t', str(duration2),
@@ -2482,33 +2796,40 @@ def split_clip(session_id):
         logger.info(f"Part 2: {split_time}s -> {clip_end}s ({duration2}s)")
         
         # Execute FFmpeg commands
-        subprocess.run(cmd1, check=True, capture_output=True)
-        subprocess.run(cmd2, check=True, capture_output=True)
+        subprocess.run(cmd1, check=True, **FFMPEG_RUN_KW)
+        subprocess.run(cmd2, check=True, **FFMPEG_RUN_KW)
 
         # If metadata exists for the original, also split its temp clip and create metas for parts
         original_meta_path = original_clip_path.replace('.mp4', '.meta.json')
-        if os.path.exists(original_meta_path):
+        try:
+            with open(original_meta_path, 'r') as f:
+                orig_meta = json.load(f)
+        except (OSError, ValueError):
+            orig_meta = None
+        if orig_meta:
             try:
-                with open(original_meta_path, 'r') as f:
-                    orig_meta = json.load(f)
                 temp_name = orig_meta.get('temp_clip')
                 if temp_name:
                     source_temp_path = os.path.join(TEMP_FOLDER, temp_name)
                     if os.path.exists(source_temp_path):
                         # Create temp parts
-                        part1_temp = os.path.join(TEMP_FOLDER, f"temp_{session_id}_{timestamp}_1.mp4")
-                        part2_temp = os.path.join(TEMP_FOLDER, f"temp_{session_id}_{timestamp}_2.mp4")
-
-                        # Build commands to split the temp clip at time_in_clip
+                        part1_temp = _TEMP_DIR + f"temp_{session_id}_{timestamp}_1.mp4"
+                        part2_temp = _TEMP_DIR + f"temp_{session_id}_{timestamp}_2.mp4"
+
+                        # Build commands to split the temp clip at time_in_clip.
+                        # Stream copy can only start on a keyframe, so part 2 keeps the
+                        # packets from the preceding keyframe; the MP4 edit list marks that
+                        # pre-roll so reformatting the part still starts at time_in_clip
+                        # (make_zero would rebase it and expose the extra frames).
                         cmd1t = [
-                            'ffmpeg', '-y',
+                            'ffmpeg', *FFMPEG_QUIET_ARGS, '-y',
                             '-i', source_temp_path,
                             '-t', str(duration1),
                             '-c', 'copy',
                             part1_temp
                         ]
                         cmd2t = [
-                            'ffmpeg', '-y',
+                            'ffmpeg', *FFMPEG_QUIET_ARGS, '-y',
                             '-ss', str(time_in_clip),
                             '-i', source_temp_path,
                             '-t', str(duration2),
@@ -2516,8 +2837,8 @@ def split_clip(session_id):
                             part2_temp
                         ]
 
-                        subprocess.run(cmd1t, check=True, capture_output=True)
-                        subprocess.run(cmd2t, check=True, capture_output=True)
+                        subprocess.run(cmd1t, check=True, **FFMPEG_RUN_KW)
+                        subprocess.run(cmd2t, check=True, **FFMPEG_RUN_KW)
 
                         # Write meta for parts so reformat can use their temp clips
                         meta1 = {
@@ -2541,56 +2862,43 @@ def split_clip(session_id):
         
         # Delete original clip (and its meta if present)
         os.remove(original_clip_path)
-        try:
-            if os.path.exists(original_meta_path):
-                os.remove(original_meta_path)
-        except Exception:
-            pass
+        _unlink(original_meta_path)
         
         logger.info(f"Successfully split {filename} into {part1_filename} and {part2_filename}")
 
         # Update processing_sessions so Studio reload reflects split
         try:
-            sess = processing_sessions.get(session_id)
-            if sess is not None:
-                clips_list = sess.get('clips', [])
-                # Find original entry
-                idx = next((i for i, c in enumerate(clips_list) if c.get('filename') == filename), -1)
-                # Load orig meta for letterbox flag
-                orig_letterbox = False
-                orig_desc = None
-                try:
-                    with open(original_meta_path, 'r') as f:
-                        om = json.load(f)
-                        orig_letterbox = bool(om.get('original_letterbox', False))
-                except Exception:
-                    pass
-                if idx >= 0:
-                    try:
+            with get_session_lock(session_id):
+                sess = processing_sessions.get(session_id)
+                if sess is not None:
+                    clips_list = sess.get('clips', [])
+                    # Find original entry
+                    idx = find_session_clip(session_id, clips_list, filename)
+                    # Letterbox flag from the meta loaded above (the file is already deleted)
+                    orig_letterbox = bool(orig_meta.get('original_letterbox', False)) if orig_meta else False
+                    if idx >= 0:
                         orig_desc = clips_list[idx].get('description')
-                    except Exception:
-                        pass
-                    # Build two new entries (start fresh from 0)
-                    clips_list.pop(idx)
-                    clips_list[idx:idx] = [
-                        {
-                            'filename': part1_filename,
-                            'path': f"/api/stream/{session_id}/{part1_filename}",
-                            'description': orig_desc or 'Split Part 1',
-                            'start_time': format_seconds_mmss(0),
-                            'end_time': format_seconds_mmss(duration1),
-                            'letterbox': orig_letterbox
-                        },
-                        {
-                            'filename': part2_filename,
-                            'path': f"/api/stream/{session_id}/{part2_filename}",
-                            'description': orig_desc or 'Split Part 2',
-                            'start_time': format_seconds_mmss(0),
-                            'end_time': format_seconds_mmss(duration2),
-                            'letterbox': orig_letterbox
-                        }
-                    ]
-                    sess['clips'] = clips_list
+                        # Replace the original with two new entries (start fresh from 0)
+                        clips_list[idx:idx + 1] = [
+                            {
+                                'filename': part1_filename,
+                                'path': f"/api/stream/{session_id}/{part1_filename}",
+                                'description': orig_desc or 'Split Part 1',
+                                'start_time': format_seconds_mmss(0),
+                                'end_time': format_seconds_mmss(duration1),
+                                'letterbox': orig_letterbox
+                            },
+                            {
+                                'filename': part2_filename,
+                                'path': f"/api/stream/{session_id}/{part2_filename}",
+                                'description': orig_desc or 'Split Part 2',
+                                'start_time': format_seconds_mmss(0),
+                                'end_time': format_seconds_mmss(duration2),
+                                'letterbox': orig_letterbox
+                            }
+                        ]
+                        sess['clips'] = clips_list
+                        index_session_clips(session_id, clips_list)
         except Exception as e:
             logger.warning(f"Could not update session clips after split: {e}")
         
@@ -2618,7 +2926,6 @@ def split_clip(session_id):
         
     except Exception as e:
         logger.error(f"Split clip error: {e}")
-        import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
@@ -2629,24 +2936,29 @@ def delete_clip(session_id, filename):
         session_folder = os.path.join(OUTPUT_FOLDER, session_id)
         clip_path = os.path.join(session_folder, filename)
         
-        if not os.path.exists(clip_path):
-            return jsonify({'error': 'Clip not found'}), 404
-        
         # Delete the clip file
-        os.remove(clip_path)
+        try:
+            os.remove(clip_path)
+        except FileNotFoundError:
+            return jsonify({'error': 'Clip not found'}), 404
         
         # Also delete metadata if it exists
-        metadata_file = clip_path.replace('.mp4', '.meta.json')
-        if os.path.exists(metadata_file):
-            os.remove(metadata_file)
+        _unlink(clip_path.replace('.mp4', '.meta.json'))
         
         logger.info(f"Successfully deleted {filename}")
 
         # Update processing_sessions to remove the clip
         try:
-            sess = processing_sessions.get(session_id)
-            if sess and 'clips' in sess:
-                sess['clips'] = [c for c in sess['clips'] if c.get('filename') != filename]
+            with get_session_lock(session_id):
+                sess = processing_sessions.get(session_id)
+                if sess and 'clips' in sess:
+                    idx = find_session_clip(session_id, sess['clips'], filename)
+                    if idx >= 0:
+                        sess['clips'].pop(idx)
+                        index_session_clips(session_id, sess['clips'])
+                last_clip_deleted = bool(sess) and sess.get('clips') == []
+            if last_clip_deleted:
+                release_session_clips(session_id)
         except Exception as e:
             logger.warning(f"Could not update session clips after delete: {e}")
         
@@ -2660,13 +2972,46 @@ def delete_clip(session_id, filename):
         return jsonify({'error': str(e)}), 500
 
 # Serve static files from React build
+DIST_FOLDER = 'dist'
+
+def scan_dist_files():
+    """Return the relative (posix) paths of all files under the React build"""
+    root = Path(DIST_FOLDER)
+    if not root.is_dir():
+        return frozenset()
+    return frozenset(p.relative_to(root).as_posix() for p in root.rglob('*') if p.is_file())
+
+# Known build files, so serving an asset is a set lookup instead of a stat
+DIST_FILES = scan_dist_files()
+
+def refresh_dist_files(*_):
+    """Rescan dist/ after a rebuild (bound to SIGHUP)"""
+    global DIST_FILES
+    DIST_FILES = scan_dist_files()
+    logger.info(f"Rescanned {DIST_FOLDER}/: {len(DIST_FILES)} files")
+
+if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGHUP, refresh_dist_files)
+
 @app.route('/<path:path>')
 def serve_static(path):
-    if os.path.exists(os.path.join('dist', path)):
-        return send_from_directory('dist', path)
+    if path in DIST_FILES:
+        is_hashed_asset = path.startswith('assets/')
+        accel_prefix = app.config['X_ACCEL_REDIRECT_PREFIX']
+        if accel_prefix:
+            # nginx serves the bytes from its internal location via sendfile
+            response = make_response('')
+            response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{path}"
+        else:
+            response = send_from_directory(
+                DIST_FOLDER, path, max_age=STATIC_ASSET_MAX_AGE if is_hashed_asset else None
+            )
+        if is_hashed_asset:
+            response.headers['Cache-Control'] = f'public, max-age={STATIC_ASSET_MAX_AGE}, immutable'
+        return response
     else:
         # Serve index.html for client-side routing
-        return send_from_directory('dist', 'index.html')
+        return send_from_directory(DIST_FOLDER, 'index.html')
 
 if __name__ == '__main__':
     debug_mode = os.getenv("FLASK_DEBUG", "0") == "1"
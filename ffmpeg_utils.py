@@ -0,0 +1,192 @@
+"""
+FFmpeg helpers shared by the clip pipeline and the smart-crop modules:
+quiet subprocess runs and hardware encoder selection with libx264 fallback
+"""
+
+import os
+import logging
+import functools
+import subprocess
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# FFmpeg only reports errors; stdout is discarded and stderr kept for failures.
+# -nostdin stops worker-thread encodes from polling the server's terminal for
+# keypresses (and from being stopped by SIGTTIN when the server is backgrounded)
+FFMPEG_QUIET_ARGS = ['-hide_banner', '-nostdin', '-loglevel', 'error', '-nostats']
+FFMPEG_RUN_KW = dict(stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+# Output frame size per resolution and aspect ratio, shared by the clip
+# pipeline and both smart-crop modules
+RESOLUTION_TARGETS = MappingProxyType({
+    "4K": MappingProxyType({"9:16": (2160, 3840), "16:9": (3840, 2160), "1:1": (2160, 2160)}),
+    "1080p": MappingProxyType({"9:16": (1080, 1920), "16:9": (1920, 1080), "1:1": (1080, 1080)}),
+    "720p": MappingProxyType({"9:16": (720, 1280), "16:9": (1280, 720), "1:1": (720, 720)}),
+    "480p": MappingProxyType({"9:16": (480, 854), "16:9": (854, 480), "1:1": (480, 480)}),
+})
+# Smart-crop encodes use lighter bitrates than the main pipeline (no 4K entry:
+# smart crop falls back to the standard crop there)
+SMART_CROP_BITRATES = MappingProxyType({"1080p": "3M", "720p": "2M", "480p": "1M"})
+
+# Hardware H.264 encoders in order of preference. An encoder listed by
+# `ffmpeg -encoders` may still lack a device, so each is verified with a tiny
+# test encode before use.
+HW_ENCODER_CANDIDATES = ('h264_nvenc', 'h264_qsv', 'h264_videotoolbox')
+
+# Decoder acceleration matching each hardware encoder. Decoded frames are
+# still downloaded to system memory so the CPU filter graphs keep working.
+HW_DECODE_ARGS = {
+    'h264_nvenc': ['-hwaccel', 'cuda'],
+    'h264_qsv': ['-hwaccel', 'qsv'],
+    'h264_videotoolbox': ['-hwaccel', 'videotoolbox'],
+}
+
+# Consumer NVIDIA cards allow only a few concurrent NVENC sessions; parallel clip
+# workers queue here rather than failing with "out of sessions" and paying the
+# libx264 fallback
+HW_ENCODE_SLOTS = threading.BoundedSemaphore(max(1, int(os.getenv('HW_ENCODE_SESSIONS', '2'))))
+
+# Keeps decoded frames in VRAM so GPU filters (scale_cuda) read them directly
+CUDA_FRAMES_ARGS = ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
+
+# A failed GPU-filter encode falls back to the CPU graph for that clip only.
+# After this many failures in a row (e.g. an FFmpeg build whose scale_cuda lacks
+# force_original_aspect_ratio) clips skip the GPU graph for GPU_FILTER_COOLDOWN
+# seconds, then it is tried again
+GPU_FILTER_FAILURE_LIMIT = 3
+GPU_FILTER_COOLDOWN = 600
+_gpu_filter_lock = threading.Lock()
+_gpu_filter_failures = 0
+_gpu_filters_off_until = 0.0
+
+def _gpu_filters_enabled():
+    """False while the GPU filter graph is paused after repeated failures"""
+    with _gpu_filter_lock:
+        return time.monotonic() >= _gpu_filters_off_until
+
+def _record_gpu_filter_outcome(ok):
+    """Count consecutive GPU-filter failures; pause the GPU graph once the limit is hit"""
+    global _gpu_filter_failures, _gpu_filters_off_until
+    with _gpu_filter_lock:
+        if ok:
+            _gpu_filter_failures = 0
+            return
+        _gpu_filter_failures += 1
+        if _gpu_filter_failures >= GPU_FILTER_FAILURE_LIMIT:
+            _gpu_filter_failures = 0
+            _gpu_filters_off_until = time.monotonic() + GPU_FILTER_COOLDOWN
+            logger.warning(f"⚠️ GPU filter graph failed {GPU_FILTER_FAILURE_LIMIT} times in a row; "
+                           f"using CPU filters for {GPU_FILTER_COOLDOWN}s")
+
+def run_ffmpeg(cmd, timeout):
+    """Run an FFmpeg command with stdout discarded and stderr spooled to a temp file.
+
+    A temp file never fills up the way a pipe does, so chatty long encodes
+    cannot stall on stderr. Returns (returncode, stderr_text); stderr is
+    only read back on failure.
+    """
+    with tempfile.TemporaryFile() as stderr_f:
+        result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=stderr_f, timeout=timeout)
+        if result.returncode == 0:
+            return result.returncode, ''
+        stderr_f.seek(0)
+        return result.returncode, stderr_f.read().decode(errors='replace')
+
+def extract_frame_jpeg(video_path, seconds, timeout=30):
+    """Return one frame at `seconds` as JPEG bytes (None on failure).
+
+    -ss before -i seeks to the nearest keyframe and decodes forward only to
+    the requested time, so sampling N frames decodes close to N frames rather
+    than everything between samples.
+    """
+    try:
+        result = subprocess.run(
+            ['ffmpeg', *FFMPEG_QUIET_ARGS, '-ss', f"{max(0.0, seconds):.3f}", '-i', video_path,
+             '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'mjpeg', '-q:v', '2', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=timeout
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Frame extraction at {seconds:.2f}s failed: {e}")
+        return None
+    return result.stdout if result.returncode == 0 and result.stdout else None
+
+@functools.lru_cache(maxsize=None)
+def detect_video_encoder():
+    """Return the H.264 encoder to use: a working hardware encoder or 'libx264'.
+
+    FFMPEG_HWENC=off forces software encoding; FFMPEG_HWENC=<encoder> pins one.
+    Probed once per process.
+    """
+    preference = os.getenv('FFMPEG_HWENC', 'auto').strip().lower()
+    if preference in ('off', '0', 'none', 'libx264'):
+        return 'libx264'
+    candidates = HW_ENCODER_CANDIDATES if preference == 'auto' else (preference,)
+    try:
+        listed = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-encoders'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=10
+        ).stdout
+        for encoder in candidates:
+            if encoder not in listed:
+                continue
+            probe = subprocess.run(
+                ['ffmpeg', *FFMPEG_QUIET_ARGS, '-f', 'lavfi', '-i', 'color=black:size=256x256:duration=0.1',
+                 '-frames:v', '1', '-c:v', encoder, '-f', 'null', '-'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15
+            )
+            if probe.returncode == 0:
+                logger.info(f"⚡ Hardware encoder available: {encoder}")
+                return encoder
+    except Exception as e:
+        logger.warning(f"Hardware encoder detection failed: {e}")
+    logger.info("Using software encoder: libx264")
+    return 'libx264'
+
+def video_encoder_args(encoder, bitrate, preset, crf=None):
+    """FFmpeg output args for the given H.264 encoder at the target bitrate.
+
+    crf applies to libx264 (and maps to NVENC's -cq); None keeps plain bitrate mode.
+    """
+    rate_args = ['-b:v', bitrate, '-maxrate', bitrate, '-bufsize', f"{int(bitrate[:-1]) * 2}M"]
+    if encoder == 'h264_nvenc':
+        return ['-c:v', encoder, '-preset', 'p4', '-tune', 'hq', '-rc', 'vbr',
+                '-cq', str(crf if crf is not None else 23), *rate_args]
+    if encoder == 'h264_qsv':
+        return ['-c:v', encoder, '-preset', preset, *rate_args]
+    if encoder == 'h264_videotoolbox':
+        return ['-c:v', encoder, '-b:v', bitrate]
+    args = ['-c:v', 'libx264', *rate_args, '-preset', preset]
+    if crf is not None:
+        args += ['-crf', str(crf)]
+    return args
+
+def run_ffmpeg_encode(build_cmd, bitrate, preset, timeout, crf=None, build_gpu_cmd=None):
+    """Run build_cmd(input_args, video_args) with the detected encoder.
+
+    With NVENC, build_gpu_cmd (same signature, GPU filter graph) is tried first
+    so decode, scaling and encode share VRAM. Hardware encodes also request
+    matching hardware decode; if a hardware encode fails it is retried once
+    with libx264. Returns (returncode, stderr_text).
+    """
+    encoder = detect_video_encoder()
+    if encoder != 'libx264':
+        with HW_ENCODE_SLOTS:
+            if encoder == 'h264_nvenc' and build_gpu_cmd is not None and _gpu_filters_enabled():
+                returncode, stderr = run_ffmpeg(
+                    build_gpu_cmd(CUDA_FRAMES_ARGS, video_encoder_args(encoder, bitrate, preset, crf)), timeout=timeout)
+                _record_gpu_filter_outcome(returncode == 0)
+                if returncode == 0:
+                    return returncode, stderr
+                logger.warning(f"⚠️ GPU filter graph failed, retrying this clip with CPU filters: {stderr[-300:]}")
+            returncode, stderr = run_ffmpeg(
+                build_cmd(HW_DECODE_ARGS.get(encoder, []), video_encoder_args(encoder, bitrate, preset, crf)),
+                timeout=timeout)
+        if returncode == 0:
+            return returncode, stderr
+        logger.warning(f"⚠️ {encoder} encode failed, retrying with libx264: {stderr[-300:]}")
+    return run_ffmpeg(build_cmd([], video_encoder_args('libx264', bitrate, preset, crf)), timeout=timeout)
@@ -7,29 +7,81 @@ Keeps main subjects centered when changing aspect ratios
 
 import cv2
 import numpy as np
-import subprocess
 import json
 import os
 import tempfile
 import logging
+import threading
+
+from ffmpeg_utils import FFMPEG_QUIET_ARGS, RESOLUTION_TARGETS, SMART_CROP_BITRATES, extract_frame_jpeg, run_ffmpeg_encode
 
 logger = logging.getLogger(__name__)
 
+# Haar detection runs on a frame downscaled by this factor (cost is O(pixels));
+# detections are scaled back to full-frame coordinates
+DETECT_DOWNSCALE = 2
+
+def is_static_subject(sample_faces, frame_width, num_samples):
+    """Decide the letterbox pre-check from per-sample face boxes ((x, y, w, h, ...) each).
+
+    Static when more than 70% of the num_samples samples hold exactly one face
+    centered in the middle third, with a horizontal spread under 5% of the width.
+    """
+    centers = []
+    for faces in sample_faces:
+        if len(faces) != 1 or frame_width <= 0:
+            continue
+        x, y, w, h = faces[0][:4]
+        center_x = (x + w / 2) / frame_width
+        if 1 / 3 <= center_x <= 2 / 3:
+            centers.append(center_x)
+    
+    detection_rate = len(centers) / num_samples if num_samples else 0.0
+    spread = float(np.std(centers)) if centers else 1.0
+    is_static = detection_rate > 0.7 and spread < 0.05
+    logger.info(f"Letterbox pre-check: single centered face in {detection_rate:.0%} of samples, "
+                f"spread {spread:.3f} → {'static subject' if is_static else 'ambiguous'}")
+    return is_static
+
 class SmartCropper:
     def __init__(self):
         """Initialize face detection models"""
-        # Load face detection classifier (Haar Cascade)
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        
-        # Alternative: Upper body detection for wider shots
-        self.body_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_upperbody.xml'
-        )
-        
         # DNN-based face detector for better accuracy
         self.load_dnn_detector()
+        
+        # The global instance is shared by parallel clip workers, so the Haar
+        # classifiers (not documented as thread-safe) and the grayscale buffers
+        # are created per thread
+        self._local = threading.local()
+    
+    def _cascade(self, name, filename):
+        """Return this thread's Haar classifier, loading it on first use"""
+        cascade = getattr(self._local, name, None)
+        if cascade is None:
+            cascade = cv2.CascadeClassifier(cv2.data.haarcascades + filename)
+            setattr(self._local, name, cascade)
+        return cascade
+    
+    @property
+    def face_cascade(self):
+        """Frontal face classifier (Haar Cascade)"""
+        return self._cascade('face_cascade', 'haarcascade_frontalface_default.xml')
+    
+    @property
+    def body_cascade(self):
+        """Upper body classifier, the fallback for wider shots"""
+        return self._cascade('body_cascade', 'haarcascade_upperbody.xml')
+    
+    def _gray_buffers(self, frame_height, frame_width):
+        """Return (full, downscaled) uint8 buffers for this thread and frame size"""
+        buffers = getattr(self._local, 'gray', None)
+        if buffers is None or buffers[0].shape != (frame_height, frame_width):
+            buffers = (
+                np.empty((frame_height, frame_width), np.uint8),
+                np.empty((frame_height // DETECT_DOWNSCALE, frame_width // DETECT_DOWNSCALE), np.uint8),
+            )
+            self._local.gray = buffers
+        return buffers
     
     def load_dnn_detector(self):
         """Load DNN-based face detector for better accuracy"""
@@ -54,59 +106,65 @@ class SmartCropper:
     def detect_faces(self, frame):
         """Detect faces in a frame using multiple methods"""
         faces = []
+        k = DETECT_DOWNSCALE
+        full_gray, gray = self._gray_buffers(*frame.shape[:2])
         
-        # Convert to grayscale for Haar Cascade
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Convert to grayscale for Haar Cascade, then downscale into the reused buffers
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=full_gray)
+        cv2.resize(full_gray, (gray.shape[1], gray.shape[0]), dst=gray, interpolation=cv2.INTER_AREA)
         
         # Improve contrast for better detection
-        gray = cv2.equalizeHist(gray)
+        cv2.equalizeHist(gray, dst=gray)
         
         # Method 1: Haar Cascade face detection with more sensitive parameters
         haar_faces = self.face_cascade.detectMultiScale(
             gray, scaleFactor=1.05, minNeighbors=3, minSize=(20, 20)
         )
-        faces.extend([(x, y, w, h) for x, y, w, h in haar_faces])
+        faces.extend([(x * k, y * k, w * k, h * k) for x, y, w, h in haar_faces])
         
         # If no faces found, try upper body detection
         if not faces:
             bodies = self.body_cascade.detectMultiScale(
-                gray, scaleFactor=1.05, minNeighbors=3, minSize=(40, 40)
+                gray, scaleFactor=1.05, minNeighbors=3, minSize=(40 // k, 40 // k)
             )
             # Upper body usually includes face, so adjust the region
             for x, y, w, h in bodies:
                 # Focus on upper third of body detection (likely face area)
-                faces.append((x, y, w, h//2))
+                faces.append((x * k, y * k, w * k, (h * k)//2))
         
         return faces
     
     def calculate_focus_point(self, faces, frame_width, frame_height):
         """Calculate the optimal focus point based on detected faces"""
-        if not faces:
+        if len(faces) == 0:
             # No faces detected, use center
             return frame_width // 2, frame_height // 2
         
-        # Calculate center of mass of all detected faces
-        total_x = 0
-        total_y = 0
-        total_weight = 0
-        
-        for (x, y, w, h) in faces:
-            # Use face area as weight (larger faces are more important)
-            weight = w * h
-            center_x = x + w // 2
-            center_y = y + h // 2
-            
-            total_x += center_x * weight
-            total_y += center_y * weight
-            total_weight += weight
-        
-        if total_weight > 0:
-            focus_x = int(total_x / total_weight)
-            focus_y = int(total_y / total_weight)
-        else:
-            focus_x = frame_width // 2
-            focus_y = frame_height // 2
+        # Center of mass of all detected faces, weighted by face area
+        # (larger faces are more important)
+        f = np.asarray(faces, dtype=np.int64).reshape(-1, 4)
+        weights = f[:, 2] * f[:, 3]
+        center_x = f[:, 0] + f[:, 2] // 2
+        center_y = f[:, 1] + f[:, 3] // 2
+        
+        # Drop centers outside median ± 1.5*IQR (stray false positives) when there
+        # are enough detections for quartiles to mean something
+        if len(f) >= 4:
+            keep = np.ones(len(f), dtype=bool)
+            for c in (center_x, center_y):
+                q1, q3 = np.percentile(c, [25, 75])
+                spread = 1.5 * (q3 - q1)
+                med = np.median(c)
+                keep &= (c >= med - spread) & (c <= med + spread)
+            if keep.any():
+                weights, center_x, center_y = weights[keep], center_x[keep], center_y[keep]
+        
+        total_weight = weights.sum()
+        if total_weight <= 0:
+            return frame_width // 2, frame_height // 2
         
+        focus_x = int((center_x * weights).sum() / total_weight)
+        focus_y = int((center_y * weights).sum() / total_weight)
         return focus_x, focus_y
     
     def calculate_crop_region(self, focus_x, focus_y, frame_width, frame_height, 
@@ -176,6 +234,7 @@ class SmartCropper:
         frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()  # Properties only; sampled frames come from FFmpeg keyframe seeks
         
         logger.info(f"Video: {frame_width}x{frame_height}, {total_frames} frames @ {fps:.1f} fps")
         
@@ -194,7 +253,7 @@ class SmartCropper:
             target_width = int(frame_height * target_aspect)
         
         # Sample frames and analyze
-        focus_points = []
+        all_faces = []
         faces_detected_count = 0
         frame_count = 0
         samples_taken = 0
@@ -202,39 +261,36 @@ class SmartCropper:
         # Calculate sample interval for even distribution
         sample_interval = max(total_frames // max_samples, sample_rate)
         
-        while cap.isOpened() and samples_taken < max_samples:
+        while samples_taken < max_samples:
             # Jump to next sample position
             sample_position = min(samples_taken * sample_interval, total_frames - 1)
-            cap.set(cv2.CAP_PROP_POS_FRAMES, sample_position)
-            
-            ret, frame = cap.read()
-            if not ret:
+            jpeg = extract_frame_jpeg(video_path, sample_position / (fps or 30.0))
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) if jpeg else None
+            if frame is None:
                 break
             
             faces = self.detect_faces(frame)
             if faces:
                 faces_detected_count += 1
+                all_faces.extend(faces)
                 focus_x, focus_y = self.calculate_focus_point(faces, frame_width, frame_height)
-                focus_points.append((focus_x, focus_y))
                 logger.info(f"Sample {samples_taken + 1}: Found {len(faces)} faces at ({focus_x}, {focus_y})")
             else:
                 logger.info(f"Sample {samples_taken + 1}: No faces detected")
             
             samples_taken += 1
         
-        cap.release()
-        
         # If we detected faces in less than 40% of samples, don't use smart crop
         detection_rate = faces_detected_count / max(samples_taken, 1)
         if detection_rate < 0.4:
             logger.info(f"⚠️ Low face detection rate ({detection_rate:.0%}), smart crop may not be suitable")
             return None  # Signal to use center crop instead
         
-        # Calculate average focus point from detected faces
-        if focus_points:
-            avg_focus_x = int(sum(p[0] for p in focus_points) / len(focus_points))
-            avg_focus_y = int(sum(p[1] for p in focus_points) / len(focus_points))
-            logger.info(f"✓ Average focus point from {len(focus_points)} detections: ({avg_focus_x}, {avg_focus_y})")
+        # Weighted centroid over every face detected in every sample (not a mean of
+        # per-frame centroids), with outliers dropped
+        if all_faces:
+            avg_focus_x, avg_focus_y = self.calculate_focus_point(all_faces, frame_width, frame_height)
+            logger.info(f"✓ Focus point from {len(all_faces)} face detections in {faces_detected_count} samples: ({avg_focus_x}, {avg_focus_y})")
         else:
             # No faces detected at all, return None to use center crop
             logger.info("⚠️ No faces detected in any sample")
@@ -249,6 +305,37 @@ class SmartCropper:
         
         return crop_params
     
+    def is_static_single_subject(self, video_path, num_samples=5):
+        """
+        Cheap local check for a static talking head: one face, inside the middle
+        third of the frame, barely moving across samples. Such clips crop to 9:16
+        cleanly, so no letterbox is needed.
+        
+        Returns:
+            True for a static single subject, False otherwise (ambiguous clips
+            should be left to the Gemini letterbox analysis)
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return False
+        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        cap.release()
+        if frame_width <= 0 or total_frames <= 0:
+            return False
+        
+        duration = total_frames / fps
+        sample_faces = []
+        for n in range(num_samples):
+            # Sample mid-interval points so the first/last frames (often fades) are skipped
+            jpeg = extract_frame_jpeg(video_path, duration * (n + 0.5) / num_samples)
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) if jpeg else None
+            if frame is not None:
+                sample_faces.append(self.detect_faces(frame))
+        
+        return is_static_subject(sample_faces, frame_width, num_samples)
+    
     def generate_ffmpeg_filter(self, crop_params):
         """Generate FFmpeg filter string for smart cropping"""
         if not crop_params:
@@ -291,46 +378,37 @@ class SmartCropper:
             # Generate FFmpeg filter
             filter_str = self.generate_ffmpeg_filter(crop_params)
             
-            # Resolution settings
-            resolution_map = {
-                "1080p": {"9:16": (1080, 1920), "16:9": (1920, 1080), "1:1": (1080, 1080)},
-                "720p": {"9:16": (720, 1280), "16:9": (1280, 720), "1:1": (720, 720)},
-                "480p": {"9:16": (480, 854), "16:9": (854, 480), "1:1": (480, 480)}
-            }
-            
-            target_w, target_h = resolution_map[resolution][aspect_ratio]
+            target_w, target_h = RESOLUTION_TARGETS[resolution][aspect_ratio]
             
             # The crop should already be at the correct resolution, just ensure it
             if crop_params['crop_w'] != target_w or crop_params['crop_h'] != target_h:
                 filter_str += f",scale={target_w}:{target_h}"
             
-            # Bitrate settings
-            bitrates = {"1080p": "3M", "720p": "2M", "480p": "1M"}
-            bitrate = bitrates[resolution]
+            bitrate = SMART_CROP_BITRATES[resolution]
             
-            # Build FFmpeg command
-            cmd = [
-                'ffmpeg',
-                '-i', input_path,
-                '-vf', filter_str,
-                '-c:v', 'libx264',
-                '-b:v', bitrate,
-                '-c:a', 'aac',
-                '-preset', 'fast',
-                '-y',
-                output_path
-            ]
+            # Build FFmpeg command (hardware encoder when available, else libx264)
+            def build_cmd(input_args, video_args):
+                return [
+                    'ffmpeg', *FFMPEG_QUIET_ARGS,
+                    *input_args,
+                    '-i', input_path,
+                    '-vf', filter_str,
+                    *video_args,
+                    '-c:a', 'aac',
+                    '-y',
+                    output_path
+                ]
             
             logger.info(f"🎬 Applying smart crop with face tracking")
             logger.info(f"   Filter: {filter_str}")
             
-            result = subprocess.run(cmd, capture_output=True, timeout=120)
+            returncode, stderr = run_ffmpeg_encode(build_cmd, bitrate, 'veryfast', timeout=120)
             
-            if result.returncode == 0:
+            if returncode == 0:
                 logger.info(f"✓ Smart crop complete: {output_path}")
                 return True
             else:
-                logger.error(f"FFmpeg error: {result.stderr.decode()}")
+                logger.error(f"FFmpeg error: {stderr}")
                 return False
                 
         except Exception as e:
@@ -362,3 +440,7 @@ def smart_crop_video(input_path, output_path, aspect_ratio, resolution):
     return smart_cropper.process_video_with_smart_crop(
         input_path, output_path, aspect_ratio, resolution
     )
+
+def is_static_single_subject(video_path):
+    """True when the clip is a static single-subject shot that crops without letterbox"""
+    return smart_cropper.is_static_single_subject(video_path)
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+import advanced_smart_crop
+
+
+FRAME_W, FRAME_H = 1920, 1080
+
+# One face per clip, on opposite sides of the frame
+FACE_BY_CLIP = {
+    1: [200, 400, 200, 200, 1.0],
+    2: [1500, 400, 200, 200, 1.0],
+}
+
+
+class _FakeCapture:
+    def __init__(self, path):
+        pass
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: FRAME_W,
+            cv2.CAP_PROP_FRAME_HEIGHT: FRAME_H,
+            cv2.CAP_PROP_FRAME_COUNT: 300,
+            cv2.CAP_PROP_FPS: 30.0,
+        }[prop]
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def fake_video(monkeypatch):
+    """Stub decoding, probing and encoding; record the filter each clip is encoded with"""
+    filters = {}
+
+    monkeypatch.setattr(advanced_smart_crop.cv2, "VideoCapture", _FakeCapture)
+    monkeypatch.setattr(advanced_smart_crop, "extract_frame_jpeg",
+                        lambda path, ts: path.encode())
+    # Tag each decoded frame with its clip id so the detector knows which clip it is in
+    monkeypatch.setattr(advanced_smart_crop.cv2, "imdecode",
+                        lambda buf, flags: np.full((FRAME_H, FRAME_W, 3), int(bytes(buf)[-1:]), np.uint8))
+
+    def detect(self, frame):
+        time.sleep(0.005)  # let the other clip's samples interleave
+        return [list(FACE_BY_CLIP[int(frame[0, 0, 0])])]
+
+    monkeypatch.setattr(advanced_smart_crop.AdvancedSmartCropper, "detect_all_faces", detect)
+
+    class _Probe:
+        stdout = '{"streams": [{"width": %d, "height": %d}]}' % (FRAME_W, FRAME_H)
+
+    monkeypatch.setattr(advanced_smart_crop.subprocess, "run", lambda *a, **kw: _Probe())
+
+    def encode(build_cmd, bitrate, preset, timeout=None):
+        cmd = build_cmd([], [])
+        filters[cmd[-1]] = cmd[cmd.index('-vf') + 1]
+        return 0, ''
+
+    monkeypatch.setattr(advanced_smart_crop, "run_ffmpeg_encode", encode)
+    return filters
+
+
+def _crop(clip_id):
+    return advanced_smart_crop.smooth_smart_crop_video(f"clip{clip_id}", f"out{clip_id}", '9:16', '1080p')
+
+
+def test_parallel_clips_get_independent_crops(fake_video):
+    assert _crop(1) and _crop(2)
+    solo = dict(fake_video)
+    assert solo["out1"] != solo["out2"]
+    fake_video.clear()
+
+    start = threading.Barrier(2)
+    results = {}
+
+    def worker(clip_id):
+        start.wait()
+        results[clip_id] = _crop(clip_id)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in (1, 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {1: True, 2: True}
+    assert fake_video == solo
+
+
+def test_cascades_are_per_thread():
+    main_cascades = advanced_smart_crop.AdvancedSmartCropper().face_cascade
+    other = []
+    t = threading.Thread(target=lambda: other.append(advanced_smart_crop.AdvancedSmartCropper().face_cascade))
+    t.start()
+    t.join()
+
+    assert advanced_smart_crop.AdvancedSmartCropper().face_cascade is main_cascades
+    assert other[0] is not main_cascades
+
+
+def test_precheck_analysis_is_reused_for_the_crop(fake_video, monkeypatch):
+    detect = advanced_smart_crop.AdvancedSmartCropper.detect_all_faces
+    calls = []
+
+    def counting_detect(self, frame):
+        calls.append(1)
+        return detect(self, frame)
+
+    monkeypatch.setattr(advanced_smart_crop.AdvancedSmartCropper, "detect_all_faces", counting_detect)
+
+    analysis = advanced_smart_crop.analyze_smooth_crop("clip1", '9:16')
+    samples = len(calls)
+    assert samples and analysis['crop_data']
+    assert analysis['static_single_subject'] is False  # Face sits in the left third
+
+    assert advanced_smart_crop.smooth_smart_crop_video("clip1", "out1", '9:16', '1080p', analysis=analysis)
+    assert len(calls) == samples
+    assert "out1" in fake_video
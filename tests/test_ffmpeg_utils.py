@@ -0,0 +1,42 @@
+import ffmpeg_utils
+
+
+def _encode_with_failing_gpu(monkeypatch, gpu_calls):
+    def run(cmd, timeout):
+        if cmd[0] == 'gpu':
+            gpu_calls.append(cmd)
+            return 1, 'scale_cuda failed'
+        return 0, ''
+
+    monkeypatch.setattr(ffmpeg_utils, 'detect_video_encoder', lambda: 'h264_nvenc')
+    monkeypatch.setattr(ffmpeg_utils, 'run_ffmpeg', run)
+    return ffmpeg_utils.run_ffmpeg_encode(
+        lambda inputs, video: ['cpu'], '3M', 'fast', timeout=10,
+        build_gpu_cmd=lambda inputs, video: ['gpu'])
+
+
+def test_gpu_filter_failure_falls_back_for_that_clip_only(monkeypatch):
+    monkeypatch.setattr(ffmpeg_utils, '_gpu_filter_failures', 0)
+    monkeypatch.setattr(ffmpeg_utils, '_gpu_filters_off_until', 0.0)
+    gpu_calls = []
+
+    for _ in range(ffmpeg_utils.GPU_FILTER_FAILURE_LIMIT - 1):
+        assert _encode_with_failing_gpu(monkeypatch, gpu_calls) == (0, '')
+    assert len(gpu_calls) == ffmpeg_utils.GPU_FILTER_FAILURE_LIMIT - 1
+    assert ffmpeg_utils._gpu_filters_enabled()
+
+
+def test_gpu_filters_pause_after_repeated_failures_then_recover(monkeypatch):
+    monkeypatch.setattr(ffmpeg_utils, '_gpu_filter_failures', 0)
+    monkeypatch.setattr(ffmpeg_utils, '_gpu_filters_off_until', 0.0)
+    now = [1000.0]
+    monkeypatch.setattr(ffmpeg_utils.time, 'monotonic', lambda: now[0])
+    gpu_calls = []
+
+    for _ in range(ffmpeg_utils.GPU_FILTER_FAILURE_LIMIT + 1):
+        _encode_with_failing_gpu(monkeypatch, gpu_calls)
+    assert len(gpu_calls) == ffmpeg_utils.GPU_FILTER_FAILURE_LIMIT
+
+    now[0] += ffmpeg_utils.GPU_FILTER_COOLDOWN
+    _encode_with_failing_gpu(monkeypatch, gpu_calls)
+    assert len(gpu_calls) == ffmpeg_utils.GPU_FILTER_FAILURE_LIMIT + 1
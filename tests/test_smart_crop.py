@@ -0,0 +1,21 @@
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+import smart_crop
+
+
+def test_shared_cropper_gives_each_thread_its_own_cascades():
+    cropper = smart_crop.smart_cropper
+    main = (cropper.face_cascade, cropper.body_cascade)
+    other = []
+    t = threading.Thread(target=lambda: other.append((cropper.face_cascade, cropper.body_cascade)))
+    t.start()
+    t.join()
+
+    assert (cropper.face_cascade, cropper.body_cascade) == main
+    assert other[0][0] is not main[0]
+    assert other[0][1] is not main[1]
@@ -1,13 +1,98 @@
+import io
 import os
+import mmap
 import json
+import time
+import asyncio
+import hashlib
 import logging
+import functools
+import tempfile
+import threading
 import subprocess
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from ffmpeg_utils import FFMPEG_QUIET_ARGS, run_ffmpeg
+try:
+    from diskcache import Cache
+except ImportError:
+    Cache = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Persistent cache of Deepgram transcriptions keyed by (file fingerprint, language, model, mode)
+TRANSCRIPT_CACHE = Cache(os.path.join('.cache', 'deepgram')) if Cache is not None else None
+TRANSCRIPT_CACHE_TTL = int(os.getenv('TRANSCRIPT_CACHE_TTL', str(7 * 86400)))  # 1 week
+DEEPGRAM_MODEL = "nova-3"
+# Deepgram options per caption mode. The app's word-by-word (karaoke) captions
+# use the raw words only, so formatting passes are skipped for them; subtitle
+# mode lets Deepgram group words into utterances; paragraph mode returns a
+# formatted, paragraphed transcript.
+CAPTION_MODE_PARAMS = {
+    "karaoke": {"smart_format": "false", "punctuate": "false", "filler_words": "false",
+                "utterances": "false", "paragraphs": "false"},
+    "subtitle": {"smart_format": "true", "punctuate": "true", "utterances": "true", "paragraphs": "false"},
+    "paragraph": {"smart_format": "true", "punctuate": "true", "utterances": "false", "paragraphs": "true"},
+}
+# Parallel Deepgram requests allowed per batch (keep within your plan's concurrency limit)
+DEEPGRAM_MAX_CONCURRENT = max(1, int(os.getenv('DEEPGRAM_MAX_CONCURRENT', '5')))
+
+# Largest body sent to Deepgram (its pre-recorded limit is 2 GB)
+DEEPGRAM_MAX_UPLOAD_BYTES = int(os.getenv('DEEPGRAM_MAX_UPLOAD_BYTES', str(2 * 1024 ** 3)))
+
+# Transient Deepgram failures are retried after these waits (Retry-After wins when sent)
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+RETRY_DELAYS = (1, 5, 15)
+# After this many consecutive failed transcriptions, fail fast for CIRCUIT_COOLDOWN seconds
+CIRCUIT_THRESHOLD = 3
+CIRCUIT_COOLDOWN = 60
+
+def file_fingerprint(path, st):
+    """Cheap content fingerprint: sha256 of the size plus the first and last MiB"""
+    block = 1 << 20
+    digest = hashlib.sha256(str(st.st_size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(block))
+        if st.st_size > block:
+            f.seek(max(block, st.st_size - block))
+            digest.update(f.read(block))
+    return digest.hexdigest()
+
+@functools.lru_cache(maxsize=1024)
+def _probe_duration(video_path, size, mtime_ns):
+    """ffprobe the container duration; size/mtime_ns key the cache to the file version
+
+    Only the container header is needed, so probing of packet data is capped.
+    Falls back to the first stream's duration when the container has none.
+    """
+    try:
+        for entries in ('format=duration', 'stream=duration'):
+            cmd = [
+                'ffprobe',
+                '-v', 'error',
+                '-probesize', '32K',
+                '-analyzeduration', '0',
+                '-select_streams', 'v:0',
+                '-show_entries', entries,
+                '-of', 'csv=p=0',
+                video_path
+            ]
+            result = subprocess.run(cmd, capture_output=True, timeout=10)
+            value = result.stdout.decode('ascii', 'ignore').strip().split('\n')[0].strip()
+            if result.returncode == 0 and value and value != 'N/A':
+                return float(value)
+        return 0.0
+    except Exception as e:
+        logger.error(f"Failed to get video duration: {e}")
+        return 0.0
+
 class WhisperService:
     """Deepgram Nova-3 API service for fast and accurate caption generation"""
     
@@ -16,147 +101,272 @@ class WhisperService:
         if not self.api_key:
             logger.warning("DEEPGRAM_API_KEY not found in environment variables")
         self.api_url = "https://api.deepgram.com/v1/listen"
+        
+        # Keep TCP/TLS connections to Deepgram alive across calls. The adapter never
+        # retries: _post_with_retries owns every retry (connection errors and
+        # 429/5xx) and re-maps the upload file for each attempt.
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=0
+        ))
+        # Sent with every request; per-call headers only add the body's type/length
+        if self.api_key:
+            self.session.headers["Authorization"] = f"Token {self.api_key}"
+        
+        # Static query parameters per caption mode; calls only add the language
+        self._mode_params = {
+            mode: {"model": DEEPGRAM_MODEL, "diarize": "false", **options}
+            for mode, options in CAPTION_MODE_PARAMS.items()
+        }
+        
+        # Circuit breaker state shared by all request threads
+        self._circuit_lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._circuit_open_until = 0.0
     
     def get_video_duration(self, video_path):
-        """Get video duration in seconds using ffprobe"""
+        """Get video duration in seconds using ffprobe (cached per file version)"""
         try:
-            cmd = [
-                'ffprobe',
-                '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                video_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                return float(result.stdout.strip())
-            return 0.0
-        except Exception as e:
+            st = os.stat(video_path)
+        except OSError as e:
             logger.error(f"Failed to get video duration: {e}")
             return 0.0
+        return _probe_duration(video_path, st.st_size, st.st_mtime_ns)
     
-    def transcribe_video(self, video_path, language="en"):
-        """Transcribe video to generate captions with precise timestamps"""
+    def _extract_audio(self, video_path):
+        """Extract the audio track as mono 16 kHz Opus into a temp .ogg.
+
+        Deepgram only listens to the audio, so this uploads a small fraction of
+        the MP4's bytes. Returns the temp path (caller deletes it) or None.
+        """
+        fd, audio_path = tempfile.mkstemp(suffix=".ogg")
+        os.close(fd)
+        try:
+            returncode, stderr = run_ffmpeg([
+                'ffmpeg', *FFMPEG_QUIET_ARGS,
+                '-i', video_path,
+                '-vn', '-ac', '1', '-ar', '16000',
+                '-c:a', 'libopus', '-b:a', '24k',
+                '-y', audio_path
+            ], timeout=300)
+            if returncode == 0 and os.path.getsize(audio_path) > 0:
+                return audio_path
+            logger.warning(f"Audio extraction failed, uploading the video instead: {stderr[-300:]}")
+        except Exception as e:
+            logger.warning(f"Audio extraction failed, uploading the video instead: {e}")
+        os.remove(audio_path)
+        return None
+    
+    def _post_with_retries(self, headers, params, upload_path=None, json_body=None):
+        """POST a file (or a JSON body) to Deepgram, retrying 429/5xx and connection errors.
+
+        The file is memory-mapped and sent as one buffer, so the socket writes
+        straight from the page cache instead of copying it through 8 KiB reads.
+        Returns the final response; raises if every attempt raised.
+        """
+        for attempt, delay in enumerate((*RETRY_DELAYS, None), 1):
+            try:
+                if upload_path is None:
+                    response = self.session.post(
+                        self.api_url, headers=headers, params=params, json=json_body, timeout=120
+                    )
+                else:
+                    with open(upload_path, "rb") as upload_file:
+                        mapped = mmap.mmap(upload_file.fileno(), 0, access=mmap.ACCESS_READ)
+                    body = memoryview(mapped)
+                    try:
+                        response = self.session.post(
+                            self.api_url,
+                            headers=headers,
+                            params=params,
+                            data=body,
+                            timeout=120
+                        )
+                    finally:
+                        # response.request still references the view; release it so the map can close
+                        body.release()
+                        try:
+                            mapped.close()
+                        except BufferError:
+                            pass  # A lingering view keeps the map alive until it is collected
+                if response.status_code not in RETRYABLE_STATUS or delay is None:
+                    return response
+                retry_after = response.headers.get("Retry-After", "")
+                wait = min(float(retry_after), 60.0) if retry_after.isdigit() else delay
+                reason = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if delay is None:
+                    raise
+                wait, reason = delay, str(e)
+            logger.warning(f"⏳ Deepgram request failed ({reason}), retrying in {wait:.0f}s (attempt {attempt}/{len(RETRY_DELAYS)})")
+            time.sleep(wait)
+    
+    def _record_outcome(self, ok):
+        """Update the circuit breaker after a transcription request"""
+        with self._circuit_lock:
+            if ok:
+                self._consecutive_failures = 0
+                return
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= CIRCUIT_THRESHOLD:
+                self._circuit_open_until = time.monotonic() + CIRCUIT_COOLDOWN
+                logger.error(f"🚫 Deepgram failed {self._consecutive_failures} times in a row; pausing requests for {CIRCUIT_COOLDOWN}s")
+    
+    def _listen_params(self, language, mode):
+        """Query parameters for Nova-3 with word-level timestamps"""
+        return {**self._mode_params[mode], "language": language}
+    
+    def _build_transcription(self, response, language, duration_fallback):
+        """Turn a Deepgram /listen response into the captions dict (or an error/None).
+
+        duration_fallback() supplies the media duration when Deepgram's metadata
+        lacks it; it is only called when there are no word timestamps.
+        """
+        if response.status_code != 200:
+            logger.error(f"Deepgram API error: {response.status_code} - {response.text}")
+            return {"error": f"Deepgram API error {response.status_code}: {response.text}"}
+        
+        # Parse JSON response (word-level timestamps run to megabytes; orjson is much faster)
+        result = orjson.loads(response.content) if orjson is not None else response.json()
+        
+        # Extract results
+        if "results" not in result:
+            logger.error("No results in response")
+            return None
+        
+        results = result["results"]
+        if "channels" not in results or len(results["channels"]) == 0:
+            logger.error("No channels in results")
+            return None
+        
+        channel = results["channels"][0]
+        if "alternatives" not in channel or len(channel["alternatives"]) == 0:
+            logger.error("No alternatives in channel")
+            return None
+        
+        alternative = channel["alternatives"][0]
+        full_text = alternative.get("paragraphs", {}).get("transcript") or alternative.get("transcript", "")
+        words = alternative.get("words", [])
+        
+        logger.info(f"✅ Received {len(words)} words with timestamps")
+        logger.info(f"📝 Full transcript: {full_text[:100]}...")
+        
+        if not words:
+            logger.warning("⚠️ No word-level timestamps available")
+            # Caption spans the whole video; Deepgram reports the duration it decoded
+            video_duration = result.get("metadata", {}).get("duration") or duration_fallback()
+            logger.info(f"📹 Video duration: {video_duration:.2f}s")
+            return {
+                "captions": [{
+                    "text": full_text,
+                    "start": 0,
+                    "end": video_duration
+                }],
+                "full_text": full_text,
+                "language": language
+            }
+        
+        utterances = results.get("utterances")
+        if utterances:
+            # Subtitle mode: one caption per utterance, grouped by Deepgram
+            captions = [
+                {"text": text, "start": utt.get("start", 0), "end": utt.get("end", 0)}
+                for utt in utterances
+                if (text := utt.get("transcript", "").strip())
+            ]
+        else:
+            # Create word-by-word captions (each word is a separate caption, blanks skipped)
+            captions = [
+                {"text": text, "start": word.get("start", 0), "end": word.get("end", 0)}
+                for word in words
+                if (text := (word.get("word") or word.get("punctuated_word") or "").strip())
+            ]
+        
+        logger.info(f"✅ Generated {len(captions)} captions")
+        
+        # Log first few captions for verification (in word mode these are the first words)
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, cap in enumerate(captions[:5]):
+                logger.debug("  Caption %d: [%.2fs - %.2fs] %s", i + 1, cap["start"], cap["end"], cap["text"][:60])
+        
+        # Return transcription data
+        return {
+            "captions": captions,
+            "full_text": full_text,
+            "language": language
+        }
+    
+    def transcribe_video(self, video_path, language="en", mode="karaoke"):
+        """Transcribe video to generate captions with precise timestamps
+
+        mode is a CAPTION_MODE_PARAMS key: "karaoke" (one caption per word),
+        "subtitle" (one per utterance) or "paragraph".
+        """
         try:
             if not self.api_key:
                 return {"error": "DEEPGRAM_API_KEY is not set. Please add it to your environment."}
 
             logger.info(f"🎬 Starting Deepgram Nova-3 transcription for: {video_path}")
             
-            # Get video duration
-            video_duration = self.get_video_duration(video_path)
-            logger.info(f"📹 Video duration: {video_duration:.2f}s")
+            # Reject unusable files before any FFmpeg or network work
+            try:
+                st = os.stat(video_path)
+            except OSError as e:
+                return {"error": f"Cannot read video file: {e}"}
+            if st.st_size == 0:
+                return {"error": "Video file is empty"}
+            
+            cache_key = None
+            if TRANSCRIPT_CACHE is not None:
+                cache_key = (file_fingerprint(video_path, st), language, DEEPGRAM_MODEL, mode)
+                cached = TRANSCRIPT_CACHE.get(cache_key)
+                if cached:
+                    logger.info(f"⚡ Using cached transcription ({len(cached['captions'])} captions)")
+                    return cached
             
-            # Read video file
-            with open(video_path, "rb") as video_file:
-                audio_data = video_file.read()
+            # Cached transcripts are still served while the circuit is open
+            if time.monotonic() < self._circuit_open_until:
+                return {"error": "Deepgram is temporarily unavailable after repeated failures. Please try again shortly."}
             
-            # Set up headers
+            # Upload only the audio when it can be extracted
+            audio_path = self._extract_audio(video_path)
+            upload_path = audio_path or video_path
+            upload_size = os.path.getsize(audio_path) if audio_path else st.st_size
+            if upload_size > DEEPGRAM_MAX_UPLOAD_BYTES:
+                if audio_path:
+                    os.remove(audio_path)
+                return {"error": f"Upload of {upload_size / 1024 ** 3:.1f} GB exceeds the "
+                                 f"{DEEPGRAM_MAX_UPLOAD_BYTES / 1024 ** 3:.1f} GB Deepgram limit"}
+            
+            # Set up headers (explicit length so the streamed body is not sent chunked)
             headers = {
-                "Authorization": f"Token {self.api_key}",
-                "Content-Type": "video/mp4"
+                "Content-Type": "audio/ogg" if audio_path else "video/mp4",
+                "Content-Length": str(upload_size)
             }
             
-            # Set up parameters for Nova-3 model with word-level timestamps
-            params = {
-                "model": "nova-3",
-                "language": language,
-                "smart_format": "true",
-                "punctuate": "true",
-                "diarize": "false",
-                "utterances": "false",
-                "paragraphs": "false"
-            }
+            params = self._listen_params(language, mode)
             
             logger.info("🎙️ Sending to Deepgram Nova-3 API...")
             
-            # Make API request
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                params=params,
-                data=audio_data,
-                timeout=120
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Deepgram API error: {response.status_code} - {response.text}")
-                return {"error": f"Deepgram API error {response.status_code}: {response.text}"}
-            
-            # Parse JSON response
-            result = response.json()
-            
-            # Extract results
-            if "results" not in result:
-                logger.error("No results in response")
-                return None
+            # Make API request, sending the file from the page cache instead of reading it into memory
+            try:
+                response = self._post_with_retries(headers, params, upload_path=upload_path)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record_outcome(False)
+                raise
+            finally:
+                if audio_path:
+                    os.remove(audio_path)
+            self._record_outcome(response.status_code not in RETRYABLE_STATUS)
             
-            results = result["results"]
-            if "channels" not in results or len(results["channels"]) == 0:
-                logger.error("No channels in results")
-                return None
-            
-            channel = results["channels"][0]
-            if "alternatives" not in channel or len(channel["alternatives"]) == 0:
-                logger.error("No alternatives in channel")
-                return None
-            
-            alternative = channel["alternatives"][0]
-            full_text = alternative.get("transcript", "")
-            words = alternative.get("words", [])
-            
-            logger.info(f"✅ Received {len(words)} words with timestamps")
-            logger.info(f"📝 Full transcript: {full_text[:100]}...")
-            
-            if not words:
-                logger.warning("⚠️ No word-level timestamps available")
-                return {
-                    "captions": [{
-                        "text": full_text,
-                        "start": 0,
-                        "end": video_duration
-                    }],
-                    "full_text": full_text,
-                    "language": language
-                }
-            
-            # Log first few words for debugging
-            for i, word in enumerate(words[:5]):
-                word_text = word.get("word", word.get("punctuated_word", ""))
-                word_start = word.get("start", 0)
-                word_end = word.get("end", 0)
-                logger.info(f"    Word {i+1}: [{word_start:.2f}s - {word_end:.2f}s] '{word_text}'")
-            
-            # Create word-by-word captions (each word is a separate caption)
-            captions = []
-            
-            for i, word in enumerate(words):
-                word_text = word.get("word", word.get("punctuated_word", "")).strip()
-                word_start = word.get("start", 0)
-                word_end = word.get("end", 0)
-                
-                if not word_text:
-                    continue
-                
-                # Each word becomes its own caption
-                captions.append({
-                    "text": word_text,
-                    "start": word_start,
-                    "end": word_end
-                })
-            
-            logger.info(f"✅ Generated {len(captions)} captions")
-            
-            # Log first few captions for verification
-            for i, cap in enumerate(captions[:3]):
-                logger.info(f"  Caption {i+1}: [{cap['start']:.2f}s - {cap['end']:.2f}s] {cap['text'][:60]}")
-            
-            # Return transcription data
-            return {
-                "captions": captions,
-                "full_text": full_text,
-                "language": language
-            }
+            transcription = self._build_transcription(
+                response, language, lambda: self.get_video_duration(video_path)
+            )
+            if cache_key is not None and transcription and "error" not in transcription:
+                TRANSCRIPT_CACHE.set(cache_key, transcription, expire=TRANSCRIPT_CACHE_TTL)
+            return transcription
             
         except Exception as e:
             logger.error(f"Deepgram transcription failed: {e}")
@@ -164,31 +374,78 @@ class WhisperService:
             logger.error(traceback.format_exc())
             return {"error": str(e)}
     
+    def transcribe_video_url(self, url, language="en", mode="karaoke"):
+        """Transcribe media Deepgram can fetch itself (e.g. a presigned S3/GCS/R2 URL).
+
+        Nothing is downloaded or re-uploaded here; Deepgram pulls the source.
+        """
+        try:
+            if not self.api_key:
+                return {"error": "DEEPGRAM_API_KEY is not set. Please add it to your environment."}
+            if time.monotonic() < self._circuit_open_until:
+                return {"error": "Deepgram is temporarily unavailable after repeated failures. Please try again shortly."}
+            
+            logger.info("🎙️ Sending media URL to Deepgram Nova-3 API...")
+            headers = {"Content-Type": "application/json"}
+            try:
+                response = self._post_with_retries(headers, self._listen_params(language, mode), json_body={"url": url})
+            except (requests.ConnectionError, requests.Timeout):
+                self._record_outcome(False)
+                raise
+            self._record_outcome(response.status_code not in RETRYABLE_STATUS)
+            return self._build_transcription(response, language, lambda: 0.0)
+        except Exception as e:
+            logger.error(f"Deepgram URL transcription failed: {e}")
+            return {"error": str(e)}
+    
+    async def transcribe_video_async(self, video_path, language="en", mode="karaoke"):
+        """Awaitable transcribe_video: the blocking upload runs in a worker thread
+        so an event loop can keep many transcriptions in flight"""
+        return await asyncio.to_thread(self.transcribe_video, video_path, language, mode)
+    
+    async def transcribe_videos(self, paths, language="en", max_concurrent=None, mode="karaoke"):
+        """Transcribe many videos concurrently, at most max_concurrent in flight.
+
+        Returns one result per path, in order; a raised exception is returned in
+        place of that path's result.
+        """
+        sem = asyncio.Semaphore(max_concurrent or DEEPGRAM_MAX_CONCURRENT)
+        
+        async def bounded(path):
+            async with sem:
+                return await self.transcribe_video_async(path, language, mode)
+        
+        return await asyncio.gather(*(bounded(p) for p in paths), return_exceptions=True)
+    
+    def transcribe_videos_sync(self, paths, language="en", max_concurrent=None, mode="karaoke"):
+        """Blocking transcribe_videos for callers without an event loop"""
+        return asyncio.run(self.transcribe_videos(paths, language, max_concurrent, mode))
+    
     def generate_srt(self, captions):
         """Generate SRT subtitle file content from captions"""
-        srt_content = []
-        
+        buf = io.StringIO()
+        self.write_srt(captions, buf)
+        return buf.getvalue()
+    
+    def write_srt(self, captions, fp):
+        """Write SRT entries to a text file object one at a time (no full copy in memory).
+
+        Callers writing to disk should open with a large buffer, e.g.
+        open(path, "w", buffering=1 << 20, encoding="utf-8").
+        """
+        to_srt_time = self._seconds_to_srt_time
+        write = fp.write
         for i, caption in enumerate(captions, 1):
-            # Format timestamps in SRT format (HH:MM:SS,mmm)
-            start_time = self._seconds_to_srt_time(caption["start"])
-            end_time = self._seconds_to_srt_time(caption["end"])
-            
-            # Add subtitle entry
-            srt_content.append(f"{i}")
-            srt_content.append(f"{start_time} --> {end_time}")
-            srt_content.append(caption["text"])
-            srt_content.append("")  # Empty line between entries
-        
-        return "\n".join(srt_content)
+            if i > 1:
+                write("\n")  # Blank line between entries
+            # Index, HH:MM:SS,mmm range, text
+            write(f"{i}\n{to_srt_time(caption['start'])} --> {to_srt_time(caption['end'])}\n{caption['text']}\n")
     
     def _seconds_to_srt_time(self, seconds):
         """Convert seconds to SRT timestamp format"""
-        if seconds is None:
-            seconds = 0
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds % 1) * 1000)
+        secs, millis = divmod(round((seconds or 0) * 1000), 1000)
+        minutes, secs = divmod(secs, 60)
+        hours, minutes = divmod(minutes, 60)
         return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
 # Global instance